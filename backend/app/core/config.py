@@ -1,3 +1,5 @@
+from functools import cached_property, lru_cache
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -18,11 +20,20 @@ class Settings(BaseSettings):
     supabase_storage_bucket: str = "paperbridge-documents"
 
     database_url: str = ""
+    db_pool_size: int = Field(default=20, ge=1, le=100)
+    db_max_overflow: int = Field(default=10, ge=0, le=100)
+    db_jobs_pool_size: int = Field(default=4, ge=1, le=100)
+    db_jobs_max_overflow: int = Field(default=2, ge=0, le=100)
 
     cors_allow_origins: str = "http://localhost:3000,http://127.0.0.1:3000"
 
     max_upload_mb: int = Field(default=25, ge=1, le=100)
     max_pages: int = Field(default=200, ge=1, le=1000)
+    vision_concurrency: int = Field(default=4, ge=1, le=16)
+    vision_batch_size: int = Field(default=8, ge=1, le=20)
+    pdf_vision_confidence_threshold: float = Field(default=0.8, ge=0, le=1)
+    extraction_min_chars: int = Field(default=20, ge=1, le=10000)
+    batch_upload_concurrency: int = Field(default=4, ge=1, le=16)
 
     chunk_size_tokens: int = Field(default=800, ge=100, le=4000)
     chunk_overlap_tokens: int = Field(default=120, ge=0, le=1000)
@@ -32,16 +43,26 @@ class Settings(BaseSettings):
     rag_lexical_weight: float = Field(default=0.35, ge=0.0, le=1.0)
     rag_context_max_tokens: int = Field(default=6000, ge=500, le=20000)
     vector_ivfflat_probes: int = Field(default=10, ge=1, le=200)
+    vector_hnsw_ef_search: int = Field(default=100, ge=10, le=1000)
+    # Document-filtered searches discard neighbours from other documents, so they search wider.
+    vector_filtered_search_factor: int = Field(default=4, ge=1, le=16)
+    # pgvector >= 0.8 only; older versions reject the hnsw.iterative_scan setting.
+    vector_hnsw_iterative_scan: bool = False
+    retrieval_cache_size: int = Field(default=128, ge=0, le=4096)
+    retrieval_cache_max_distance: float = Field(default=0.05, ge=0.0, le=0.5)
+    retrieval_cache_ttl_s: float = Field(default=300.0, ge=0.0, le=86400.0)
     embedding_batch_size: int = Field(default=100, ge=1, le=500)
+    embedding_concurrency: int = Field(default=4, ge=1, le=16)
 
     llm_retries: int = Field(default=2, ge=0, le=10)
     llm_timeout_s: int = Field(default=45, ge=5, le=180)
     ask_rate_limit_per_minute: int = Field(default=60, ge=0, le=1000)
     upload_rate_limit_per_minute: int = Field(default=20, ge=0, le=1000)
+    job_status_cache_ttl_s: float = Field(default=1.0, ge=0, le=10)
 
-    @property
-    def cors_origins(self) -> list[str]:
-        return [origin.strip() for origin in self.cors_allow_origins.split(",") if origin.strip()]
+    @cached_property
+    def cors_origins(self) -> tuple[str, ...]:
+        return tuple(origin.strip() for origin in self.cors_allow_origins.split(",") if origin.strip())
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -49,4 +70,10 @@ class Settings(BaseSettings):
         extra="ignore"
     )
 
-settings = Settings()
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
+
+
+settings = get_settings()
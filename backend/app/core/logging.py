@@ -1,3 +1,4 @@
+import json
 import logging
 import sys
 from contextvars import ContextVar
@@ -13,16 +14,31 @@ def get_request_id() -> str | None:
     return _request_id_ctx.get()
 
 
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `rid` comes from the request context, not the message."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": record.created,
+            "lvl": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "rid": _request_id_ctx.get(),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
 def setup_logging(debug: bool = False):
     level = logging.DEBUG if debug else logging.INFO
-    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    
+
     logger = logging.getLogger()
     logger.setLevel(level)
     
     if not logger.handlers:
         handler = logging.StreamHandler(sys.stdout)
-        handler.setFormatter(logging.Formatter(log_format))
+        handler.setFormatter(JsonFormatter())
         logger.addHandler(handler)
         
     logging.getLogger("uvicorn").setLevel(logging.INFO)
@@ -31,4 +47,6 @@ def setup_logging(debug: bool = False):
 
     return logger
 
-logger = setup_logging()
+
+# The root logger; handlers and level are applied once by setup_logging() in app.main.
+logger = logging.getLogger()
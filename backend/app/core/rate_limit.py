@@ -1,29 +1,64 @@
-import asyncio
 import time
-from collections import defaultdict, deque
+from array import array
+
+EVICTION_INTERVAL_CALLS = 1024
+NS_PER_SECOND = 1_000_000_000
+
+
+class _RingBucket:
+    """Timestamps of the last `limit` admitted requests for one key."""
+
+    __slots__ = ("times", "head", "count")
+
+    def __init__(self, limit: int):
+        self.times = array("q", bytes(8 * limit))
+        self.head = 0
+        self.count = 0
+
+    def newest(self) -> int:
+        return self.times[self.head - 1]
 
 
 class SlidingWindowRateLimiter:
     def __init__(self, limit: int, window_seconds: int = 60):
         self.limit = limit
         self.window_seconds = window_seconds
-        self._events: defaultdict[str, deque[float]] = defaultdict(deque)
-        self._lock = asyncio.Lock()
+        self._window_ns = window_seconds * NS_PER_SECOND
+        self._events: dict[str, _RingBucket] = {}
+        self._ops = 0
 
     async def allow(self, key: str) -> tuple[bool, int]:
         if self.limit <= 0:
             return True, 0
 
-        now = time.monotonic()
-        async with self._lock:
-            bucket = self._events[key]
-            cutoff = now - self.window_seconds
-            while bucket and bucket[0] < cutoff:
-                bucket.popleft()
+        # No awaits below: the check-and-record runs atomically on the event loop,
+        # so unrelated keys never queue behind a shared lock.
+        now = time.monotonic_ns()
+        self._ops += 1
+        if self._ops % EVICTION_INTERVAL_CALLS == 0:
+            self._evict_stale(now)
+
+        bucket = self._events.get(key)
+        if bucket is None:
+            bucket = self._events[key] = _RingBucket(self.limit)
 
-            if len(bucket) >= self.limit:
-                retry_after = max(1, int(self.window_seconds - (now - bucket[0])))
+        # Once full, `head` points at the oldest of the last `limit` admissions.
+        if bucket.count == self.limit:
+            oldest = bucket.times[bucket.head]
+            if oldest >= now - self._window_ns:
+                retry_after = max(1, (self._window_ns - (now - oldest)) // NS_PER_SECOND)
                 return False, retry_after
+        else:
+            bucket.count += 1
 
-            bucket.append(now)
-            return True, 0
+        bucket.times[bucket.head] = now
+        bucket.head = (bucket.head + 1) % self.limit
+        return True, 0
+
+    def _evict_stale(self, now: int) -> None:
+        # Keys idle for two windows cannot affect any future decision; drop them so
+        # per-client buckets do not accumulate forever under key churn.
+        stale_before = now - 2 * self._window_ns
+        stale_keys = [key for key, bucket in self._events.items() if bucket.newest() < stale_before]
+        for key in stale_keys:
+            del self._events[key]
@@ -0,0 +1,39 @@
+import time
+
+NS_PER_SECOND = 1_000_000_000
+
+
+class TTLCache:
+    """Small in-process cache whose entries expire `ttl_seconds` after they are stored."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 4096):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._ttl_ns = int(ttl_seconds * NS_PER_SECOND)
+        self._entries: dict[object, tuple[int, object]] = {}
+
+    def get(self, key: object):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic_ns():
+            del self._entries[key]
+            return None
+        return value
+
+    def set(self, key: object, value: object) -> None:
+        if self._ttl_ns <= 0:
+            return
+        now = time.monotonic_ns()
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            self._evict(now)
+        self._entries[key] = (now + self._ttl_ns, value)
+
+    def _evict(self, now: int) -> None:
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        # Every entry shares one TTL, so insertion order is expiry order; drop the oldest if still full.
+        if len(self._entries) >= self.max_entries:
+            del self._entries[next(iter(self._entries))]
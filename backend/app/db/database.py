@@ -1,25 +1,46 @@
+import pydantic_core
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from app.core.config import settings
 
-engine = create_async_engine(
-    settings.database_url,
-    echo=settings.debug,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
-)
-
-AsyncSessionLocal = async_sessionmaker(
-    engine, 
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False
-)
+
+def _create_engine(pool_size: int, max_overflow: int):
+    return create_async_engine(
+        settings.database_url,
+        echo=settings.debug,
+        pool_pre_ping=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        # JSONB columns (extraction data, job metadata) go through pydantic's Rust encoder instead of stdlib json.
+        json_serializer=pydantic_core.to_json,
+        json_deserializer=pydantic_core.from_json,
+    )
+
+
+def _session_factory(bind):
+    return async_sessionmaker(
+        bind,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autocommit=False,
+        autoflush=False
+    )
+
+
+engine = _create_engine(settings.db_pool_size, settings.db_max_overflow)
+# Background jobs get their own small pool so long extract/embed runs cannot starve request handlers.
+jobs_engine = _create_engine(settings.db_jobs_pool_size, settings.db_jobs_max_overflow)
+
+AsyncSessionLocal = _session_factory(engine)
+JobSessionLocal = _session_factory(jobs_engine)
 
 Base = declarative_base()
 
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+
+def get_session_factory() -> async_sessionmaker[AsyncSession]:
+    """For handlers that need several concurrent sessions; overridable like get_db."""
+    return AsyncSessionLocal
@@ -81,15 +81,32 @@ UPDATE embeddings SET pdf_page_start = page_start WHERE pdf_page_start IS NULL;
 UPDATE embeddings SET pdf_page_end = page_end WHERE pdf_page_end IS NULL;
 ALTER TABLE embeddings ALTER COLUMN pdf_page_start SET NOT NULL;
 ALTER TABLE embeddings ALTER COLUMN pdf_page_end SET NOT NULL;
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS content_hash VARCHAR(32);
+-- Tokenized once at write time; retrieval ranks candidates with ts_rank_cd over it.
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
 
 ALTER TABLE jobs ADD COLUMN IF NOT EXISTS task_metadata JSONB;
 
+-- Timestamps are naive UTC at the time of the writing statement (models.utc_timestamp); CURRENT_TIMESTAMP
+-- would be the transaction start, converted to the session TimeZone.
+ALTER TABLE documents ALTER COLUMN created_at SET DEFAULT timezone('UTC', clock_timestamp());
+ALTER TABLE jobs ALTER COLUMN created_at SET DEFAULT timezone('UTC', clock_timestamp());
+ALTER TABLE jobs ALTER COLUMN updated_at SET DEFAULT timezone('UTC', clock_timestamp());
+ALTER TABLE extractions ALTER COLUMN created_at SET DEFAULT timezone('UTC', clock_timestamp());
+ALTER TABLE extractions ALTER COLUMN updated_at SET DEFAULT timezone('UTC', clock_timestamp());
+ALTER TABLE review_edits ALTER COLUMN created_at SET DEFAULT timezone('UTC', clock_timestamp());
+
 -- Indexes and constraints
 CREATE INDEX IF NOT EXISTS ix_jobs_document_id_status ON jobs (document_id, status);
+-- Latest-job-per-step lookups (ORDER BY created_at DESC LIMIT 1) read id and status from the index alone.
+CREATE INDEX IF NOT EXISTS ix_jobs_doc_type_created ON jobs (document_id, task_type, created_at DESC) INCLUDE (id, status);
 CREATE INDEX IF NOT EXISTS ix_document_pages_document_id_page ON document_pages (document_id, page_number);
 CREATE INDEX IF NOT EXISTS ix_extractions_document_id ON extractions (document_id);
 CREATE INDEX IF NOT EXISTS ix_embeddings_document_id ON embeddings (document_id);
 CREATE INDEX IF NOT EXISTS ix_embeddings_document_chunk ON embeddings (document_id, chunk_id);
+-- Full-text candidate pool in retrieval (content_tsv @@ websearch_to_tsquery(...)).
+CREATE INDEX IF NOT EXISTS ix_embeddings_content_tsv ON embeddings USING gin (content_tsv);
 
 CREATE UNIQUE INDEX IF NOT EXISTS uq_documents_storage_key ON documents (storage_key);
 CREATE UNIQUE INDEX IF NOT EXISTS uq_documents_checksum_version ON documents (checksum_sha256, version);
@@ -97,18 +114,19 @@ CREATE UNIQUE INDEX IF NOT EXISTS uq_document_pages_document_page ON document_pa
 CREATE UNIQUE INDEX IF NOT EXISTS uq_embeddings_document_chunk ON embeddings (document_id, chunk_id);
 
 CREATE INDEX IF NOT EXISTS ix_documents_checksum ON documents (checksum_sha256);
-
-CREATE INDEX IF NOT EXISTS ix_embeddings_embedding
-    ON embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+CREATE INDEX IF NOT EXISTS ix_documents_created_at ON documents (created_at);
 
 DO $$
 BEGIN
     CREATE INDEX IF NOT EXISTS ix_embeddings_embedding_hnsw
-        ON embeddings USING hnsw (embedding vector_cosine_ops);
+        ON embeddings USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+    -- hnsw keeps its recall as documents arrive without retraining, so it replaces ivfflat.
+    DROP INDEX IF EXISTS ix_embeddings_embedding;
 EXCEPTION
     WHEN OTHERS THEN
-        -- hnsw may be unavailable or exceed maintenance_work_mem; ivfflat remains active.
-        NULL;
+        -- hnsw may be unavailable or exceed maintenance_work_mem; fall back to ivfflat.
+        CREATE INDEX IF NOT EXISTS ix_embeddings_embedding
+            ON embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
 END $$;
 
 CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_active_task
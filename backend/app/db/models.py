@@ -1,21 +1,32 @@
 import uuid
-from datetime import datetime
-from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, Text, UniqueConstraint
-from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, String, Integer, Float, DateTime, ForeignKey, Index, Text, UniqueConstraint, func, text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, UUID
+from sqlalchemy.orm import deferred, relationship
 from pgvector.sqlalchemy import Vector
 from app.core.config import settings
 from app.db.database import Base
 
+
+def utc_timestamp():
+    """
+    Naive UTC wall-clock time of the statement that writes the row, matching the old Python-side
+    datetime.utcnow default. clock_timestamp() rather than now(), which is fixed at transaction start.
+    """
+    return func.timezone("UTC", func.clock_timestamp())
+
+
 class Document(Base):
     __tablename__ = 'documents'
+    # A btree on created_at serves the list endpoint's ORDER BY created_at DESC via a backward scan.
+    __table_args__ = (Index("ix_documents_created_at", "created_at"),)
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     filename = Column(String, nullable=False)
     storage_key = Column(String, nullable=False)
     checksum_sha256 = Column(String(64), nullable=False)
     version = Column(Integer, nullable=False, default=1)
     total_pages = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
 
     pages = relationship("DocumentPage", back_populates="document", cascade="all, delete-orphan", order_by="DocumentPage.page_number")
     jobs = relationship("Job", back_populates="document", cascade="all, delete-orphan")
@@ -23,14 +34,26 @@ class Document(Base):
 
 class Job(Base):
     __tablename__ = 'jobs'
+    __table_args__ = (
+        Index(
+            "ix_jobs_doc_type_created",
+            "document_id",
+            "task_type",
+            text("created_at DESC"),
+            postgresql_include=["id", "status"],
+        ),
+    )
+    # Fetch server-generated timestamps via RETURNING so they are never lazy-loaded under asyncio.
+    __mapper_args__ = {"eager_defaults": True}
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.id'), nullable=False)
+    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete='CASCADE'), nullable=False)
     task_type = Column(String, nullable=False) # e.g., 'extract', 'embed'
     status = Column(String, default="queued") # queued | processing | needs_review | done | failed
     error_message = Column(Text, nullable=True)
     task_metadata = Column(JSONB, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(DateTime, server_default=utc_timestamp(), onupdate=utc_timestamp())
 
     document = relationship("Document", back_populates="jobs")
 
@@ -39,7 +62,7 @@ class DocumentPage(Base):
     __table_args__ = (UniqueConstraint("document_id", "page_number", name="uq_document_pages_document_page"),)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.id'), nullable=False)
+    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete='CASCADE'), nullable=False)
     page_number = Column(Integer, nullable=False)
     text = Column(Text, nullable=True)
     text_quality_score = Column(Float, nullable=True)
@@ -49,12 +72,14 @@ class DocumentPage(Base):
 
 class Extraction(Base):
     __tablename__ = 'extractions'
+    __mapper_args__ = {"eager_defaults": True}
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.id'), nullable=False)
+    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete='CASCADE'), nullable=False)
     data = Column(JSONB, nullable=False)
     status = Column(String, default="PASSED") # PASSED | FLAGGED | FAILED
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(DateTime, server_default=utc_timestamp(), onupdate=utc_timestamp())
 
     document = relationship("Document", back_populates="extractions")
     review_edits = relationship("ReviewEdit", back_populates="extraction", cascade="all, delete-orphan")
@@ -62,26 +87,41 @@ class Extraction(Base):
 class ReviewEdit(Base):
     __tablename__ = 'review_edits'
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    extraction_id = Column(UUID(as_uuid=True), ForeignKey('extractions.id'), nullable=False)
+    extraction_id = Column(UUID(as_uuid=True), ForeignKey('extractions.id', ondelete='CASCADE'), nullable=False)
     original_data = Column(JSONB, nullable=False)
     updated_data = Column(JSONB, nullable=False)
     edited_by = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
 
     extraction = relationship("Extraction", back_populates="review_edits")
 
 class Embedding(Base):
     __tablename__ = 'embeddings'
-    __table_args__ = (UniqueConstraint("document_id", "chunk_id", name="uq_embeddings_document_chunk"),)
+    __table_args__ = (
+        UniqueConstraint("document_id", "chunk_id", name="uq_embeddings_document_chunk"),
+        Index("ix_embeddings_document_id", "document_id"),
+        Index(
+            "ix_embeddings_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_with={"m": 16, "ef_construction": 64},
+        ),
+        Index("ix_embeddings_content_tsv", "content_tsv", postgresql_using="gin"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.id'), nullable=False)
+    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete='CASCADE'), nullable=False)
     chunk_id = Column(String, nullable=False)
     page_start = Column(Integer, nullable=False)
     page_end = Column(Integer, nullable=False)
     pdf_page_start = Column(Integer, nullable=False)
     pdf_page_end = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
+    # blake2b of embed model + content; lets re-embedding skip unchanged chunks.
+    content_hash = Column(String(32), nullable=True)
     embedding = Column(Vector(settings.openai_embed_dims), nullable=False)
+    # Generated by Postgres from content; deferred so loading a chunk does not fetch it.
+    content_tsv = deferred(Column(TSVECTOR, Computed("to_tsvector('english', content)", persisted=True)))
 
     document = relationship("Document")
@@ -1,29 +1,58 @@
+import logging
+import os
 import time
-import uuid
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
+from sqlalchemy import text
 
 from app.core.config import settings
-from app.core.logging import logger, set_request_id
+from app.core.logging import logger, set_request_id, setup_logging
 from app.core.rate_limit import SlidingWindowRateLimiter
-from app.schemas.api import ErrorResponse
+from app.db.database import engine, jobs_engine
+from app.schemas.api import ErrorDetail, ErrorResponse
 
 from app.routers import health_router, documents_router, jobs_router, ask_router, review_router
 
+setup_logging(settings.debug)
+
 ask_rate_limiter = SlidingWindowRateLimiter(settings.ask_rate_limit_per_minute, window_seconds=60)
 upload_rate_limiter = SlidingWindowRateLimiter(settings.upload_rate_limit_per_minute, window_seconds=60)
 
+# Slack for multipart boundaries and part headers on top of the file itself.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def _error_response(
+    status_code: int,
+    code: str,
+    message: str,
+    request_id: str | None,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    # Serialize straight to JSON bytes with pydantic instead of model_dump() + json.dumps.
+    body = ErrorResponse(error=ErrorDetail(code=code, message=message, request_id=request_id)).model_dump_json()
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up PaperBridge backend...")
+    # Open the first pooled connection now so the first request does not pay TCP/TLS/auth setup.
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as exc:
+        logger.warning("db_pool_warmup_failed error=%s", exc)
     yield
     # Shutdown
     logger.info("Shutting down PaperBridge backend...")
+    await engine.dispose()
+    await jobs_engine.dispose()
 
 app = FastAPI(
     title="PaperBridge API",
@@ -43,15 +72,15 @@ app = FastAPI(
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.cors_origins or ["http://localhost:3000"],
+    allow_origins=settings.cors_origins or ("http://localhost:3000",),
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS", "HEAD"],
-    allow_headers=["Authorization", "Content-Type", "X-Request-ID"],
+    allow_headers=["Authorization", "Content-Type", "X-Request-ID", "X-Content-SHA256"],
 )
 
 @app.middleware("http")
 async def request_context_middleware(request: Request, call_next):
-    request_id = request.headers.get("x-request-id", str(uuid.uuid4()))
+    request_id = request.headers.get("x-request-id") or os.urandom(16).hex()
     request.state.request_id = request_id
     set_request_id(request_id)
     start = time.perf_counter()
@@ -60,49 +89,57 @@ async def request_context_middleware(request: Request, call_next):
         if request.method == "POST" and request.url.path == "/ask":
             allowed, retry_after = await ask_rate_limiter.allow(client_host)
             if not allowed:
-                payload = ErrorResponse(
-                    error={
-                        "code": "rate_limited",
-                        "message": "Ask rate limit exceeded. Please retry later.",
-                        "request_id": request_id,
-                    }
-                ).model_dump()
-                return JSONResponse(status_code=429, content=payload, headers={"Retry-After": str(retry_after)})
+                return _error_response(
+                    429,
+                    "rate_limited",
+                    "Ask rate limit exceeded. Please retry later.",
+                    request_id,
+                    headers={"Retry-After": str(retry_after)},
+                )
         if request.method == "POST" and request.url.path in {"/documents", "/documents/batch"}:
             allowed, retry_after = await upload_rate_limiter.allow(client_host)
             if not allowed:
-                payload = ErrorResponse(
-                    error={
-                        "code": "rate_limited",
-                        "message": "Upload rate limit exceeded. Please retry later.",
-                        "request_id": request_id,
-                    }
-                ).model_dump()
-                return JSONResponse(status_code=429, content=payload, headers={"Retry-After": str(retry_after)})
+                return _error_response(
+                    429,
+                    "rate_limited",
+                    "Upload rate limit exceeded. Please retry later.",
+                    request_id,
+                    headers={"Retry-After": str(retry_after)},
+                )
+        if request.method == "POST" and request.url.path == "/documents":
+            # Reject before the body is received; chunked requests without a length still hit the
+            # size check in the router.
+            content_length = request.headers.get("content-length", "")
+            max_body_bytes = settings.max_upload_mb * 1024 * 1024 + MULTIPART_OVERHEAD_BYTES
+            if content_length.isdigit() and int(content_length) > max_body_bytes:
+                return _error_response(
+                    413,
+                    "http_413",
+                    f"File too large. Max supported size is {settings.max_upload_mb}MB.",
+                    request_id,
+                )
 
         try:
             response = await call_next(request)
         except Exception:
             duration_ms = (time.perf_counter() - start) * 1000
             logger.exception(
-                "request_failed request_id=%s method=%s path=%s duration_ms=%.2f",
-                request_id,
+                "request_failed method=%s path=%s duration_ms=%.2f",
                 request.method,
                 request.url.path,
                 duration_ms,
             )
             raise
 
-        duration_ms = (time.perf_counter() - start) * 1000
         response.headers["X-Request-ID"] = request_id
-        logger.info(
-            "request_completed request_id=%s method=%s path=%s status_code=%s duration_ms=%.2f",
-            request_id,
-            request.method,
-            request.url.path,
-            response.status_code,
-            duration_ms,
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "request_completed method=%s path=%s status_code=%s duration_ms=%.2f",
+                request.method,
+                request.url.path,
+                response.status_code,
+                (time.perf_counter() - start) * 1000,
+            )
         return response
     finally:
         set_request_id(None)
@@ -110,41 +147,32 @@ async def request_context_middleware(request: Request, call_next):
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    payload = ErrorResponse(
-        error={
-            "code": f"http_{exc.status_code}",
-            "message": str(exc.detail),
-            "request_id": getattr(request.state, "request_id", None),
-        }
-    ).model_dump()
-    return JSONResponse(status_code=exc.status_code, content=payload)
+    return _error_response(
+        exc.status_code,
+        f"http_{exc.status_code}",
+        str(exc.detail),
+        getattr(request.state, "request_id", None),
+    )
 
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    payload = ErrorResponse(
-        error={
-            "code": "validation_error",
-            "message": "Request payload validation failed.",
-            "request_id": getattr(request.state, "request_id", None),
-        }
-    ).model_dump()
-    logger.warning("validation_error request_id=%s details=%s", payload["error"]["request_id"], exc.errors())
-    return JSONResponse(status_code=422, content=payload)
+    request_id = getattr(request.state, "request_id", None)
+    if logger.isEnabledFor(logging.WARNING):
+        logger.warning("validation_error details=%s", exc.errors())
+    return _error_response(422, "validation_error", "Request payload validation failed.", request_id)
 
 
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
     request_id = getattr(request.state, "request_id", None)
-    logger.exception("unhandled_error request_id=%s", request_id)
-    payload = ErrorResponse(
-        error={
-            "code": "internal_server_error",
-            "message": "An unexpected error occurred.",
-            "request_id": request_id,
-        }
-    ).model_dump()
-    return JSONResponse(status_code=500, content=payload)
+    # This handler runs outside request_context_middleware, which has already cleared the context.
+    set_request_id(request_id)
+    try:
+        logger.exception("unhandled_error")
+    finally:
+        set_request_id(None)
+    return _error_response(500, "internal_server_error", "An unexpected error occurred.", request_id)
 
 app.include_router(health_router)
 app.include_router(documents_router)
@@ -1,21 +1,24 @@
+import asyncio
 import hashlib
+import os
 import re
+import string
 from pathlib import Path
-from typing import List
+from typing import BinaryIO, List
 from urllib.parse import urlparse
 from uuid import UUID, uuid4
 
-from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile
 from fastapi.concurrency import run_in_threadpool
 from storage3.exceptions import StorageApiError
-from sqlalchemy import delete, select
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from app.core.config import settings
 from app.core.logging import logger
-from app.db.database import get_db
-from app.db.models import Document, DocumentPage, Embedding
+from app.db.database import engine, get_db, get_session_factory
+from app.db.models import Document, DocumentPage
 from app.schemas.api import DownloadDocumentResponse, DocumentResponse, ErrorResponse, UploadDocumentResponse
 from app.services.document_status import (
     DOCUMENT_STATUS_UPLOADED,
@@ -23,22 +26,45 @@ from app.services.document_status import (
 )
 from app.services.pdf_parser import parse_pdf
 from app.services.pipeline import ensure_pipeline_job, run_pipeline_job
+from app.services.retrieval_cache import retrieval_cache
 from app.services.supabase_storage import storage_service
 
 router = APIRouter(tags=["documents"])
 
 ALLOWED_PDF_CONTENT_TYPES = {"application/pdf", "application/x-pdf", "application/octet-stream"}
-UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
 DOWNLOAD_URL_TTL_SECONDS = 60
+SHA256_HEX_RE = re.compile(r"[0-9a-f]{64}")
+# Shared by every batch upload in the process and capped at half the request pool, so concurrent
+# batches cannot hold the connections single-document requests need.
+BATCH_UPLOAD_SLOTS = asyncio.Semaphore(max(1, min(settings.batch_upload_concurrency, engine.pool.size() // 2)))
 
+# Built once at import; list_documents only chains offset/limit onto it. Result rows expose
+# the selected columns as attributes, so they feed _to_document_response like Document does.
+LIST_DOCUMENTS_STMT = select(
+    Document.id,
+    Document.filename,
+    Document.checksum_sha256,
+    Document.version,
+    Document.total_pages,
+    Document.created_at,
+).order_by(Document.created_at.desc())
+
+
+class _SafeFilenameTable(dict):
+    """str.translate table: allowlisted ASCII maps to itself, every other code point to "_"."""
+
+    def __missing__(self, codepoint: int) -> str:
+        return "_"
 
-def _safe_filename(filename: str) -> str:
-    cleaned = re.sub(r"[^A-Za-z0-9._-]", "_", Path(filename).name)
-    return cleaned[:180] or "document.pdf"
 
+_SAFE_FILENAME_TABLE = _SafeFilenameTable(
+    (ord(ch), ch) for ch in string.ascii_letters + string.digits + "._-"
+)
 
-def _compute_checksum(file_bytes: bytes) -> str:
-    return hashlib.sha256(file_bytes).hexdigest()
+
+def _safe_filename(filename: str) -> str:
+    cleaned = Path(filename).name.translate(_SAFE_FILENAME_TABLE)
+    return cleaned[:180] or "document.pdf"
 
 
 def _normalize_storage_key(storage_key: str, bucket: str) -> str:
@@ -67,16 +93,23 @@ def _normalize_storage_key(storage_key: str, bucket: str) -> str:
     return key
 
 
-async def _read_upload_bytes(upload: UploadFile, max_bytes: int) -> bytes:
-    data = bytearray()
-    while chunk := await upload.read(UPLOAD_READ_CHUNK_SIZE):
-        data.extend(chunk)
-        if len(data) > max_bytes:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File too large. Max supported size is {settings.max_upload_mb}MB.",
-            )
-    return bytes(data)
+def _hash_spooled_upload(spooled: BinaryIO, max_bytes: int) -> str:
+    """
+    Size-check and hash the SpooledTemporaryFile Starlette already filled for this upload.
+    Runs in a worker thread. The spool is rolled over to disk so parsing can mmap it and
+    storage can stream it by descriptor, with no second copy of the body.
+    """
+    size = spooled.seek(0, os.SEEK_END)
+    if size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Max supported size is {settings.max_upload_mb}MB.",
+        )
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+    spooled.fileno()
+    spooled.seek(0)
+    return hashlib.file_digest(spooled, "sha256").hexdigest()
 
 
 async def _queue_pipeline(
@@ -103,11 +136,29 @@ async def _existing_document_by_checksum(db: AsyncSession, checksum_sha256: str)
     ).scalars().first()
 
 
+async def _existing_document_for_upload(
+    db: AsyncSession,
+    checksum_sha256: str,
+    storage_key: str,
+) -> Document | None:
+    """Checksum and storage-key dedupe in one round trip; a checksum match wins over a key match."""
+    checksum_match = Document.checksum_sha256 == checksum_sha256
+    return (
+        await db.execute(
+            select(Document)
+            .where(or_(checksum_match, Document.storage_key == storage_key))
+            .order_by(checksum_match.desc(), Document.created_at.desc())
+            .limit(1)
+        )
+    ).scalars().first()
+
+
 async def _ingest_pdf_upload(
     *,
     request_id: str | None,
     file: UploadFile,
     db: AsyncSession,
+    claimed_checksum: str | None = None,
 ) -> Document:
     filename = file.filename or ""
     safe_name = _safe_filename(filename)
@@ -118,88 +169,131 @@ async def _ingest_pdf_upload(
         await file.close()
         raise HTTPException(status_code=400, detail="Unsupported content type for PDF upload.")
 
-    max_bytes = settings.max_upload_mb * 1024 * 1024
-    file_bytes = await _read_upload_bytes(file, max_bytes=max_bytes)
-    checksum_sha256 = _compute_checksum(file_bytes)
+    if claimed_checksum is not None:
+        claimed_checksum = claimed_checksum.strip().lower()
+        if not SHA256_HEX_RE.fullmatch(claimed_checksum):
+            await file.close()
+            raise HTTPException(status_code=400, detail="X-Content-SHA256 must be a hex SHA-256 digest.")
+        # A client-supplied digest lets duplicates return before the body is copied or hashed.
+        existing_doc = await _existing_document_by_checksum(db, claimed_checksum)
+        if existing_doc:
+            logger.info(
+                "upload_deduped_by_header request_id=%s checksum=%s existing_document_id=%s version=%s",
+                request_id,
+                claimed_checksum,
+                existing_doc.id,
+                existing_doc.version,
+            )
+            await file.close()
+            return existing_doc
 
-    existing_doc = await _existing_document_by_checksum(db, checksum_sha256)
-    if existing_doc:
-        logger.info(
-            "upload_deduped request_id=%s checksum=%s existing_document_id=%s version=%s",
-            request_id,
-            checksum_sha256,
-            existing_doc.id,
-            existing_doc.version,
-        )
+    max_bytes = settings.max_upload_mb * 1024 * 1024
+    spool = file.file
+    try:
+        checksum_sha256 = await run_in_threadpool(_hash_spooled_upload, spool, max_bytes)
+    except HTTPException:
         await file.close()
-        return existing_doc
+        raise
+    if claimed_checksum is not None and claimed_checksum != checksum_sha256:
+        await file.close()
+        raise HTTPException(status_code=400, detail="X-Content-SHA256 does not match the uploaded file.")
 
     version = 1
     document_id = uuid4()
     storage_key = f"documents/{checksum_sha256[:16]}/v{version}/{safe_name}"
 
-    existing_storage_doc = (
-        await db.execute(select(Document).where(Document.storage_key == storage_key).limit(1))
-    ).scalars().first()
-    if existing_storage_doc:
-        logger.info(
-            "upload_deduped_storage_key request_id=%s storage_key=%s existing_document_id=%s",
-            request_id,
-            storage_key,
-            existing_storage_doc.id,
+    # Claim the row before any work: a concurrent upload of the same file blocks on the unique
+    # indexes until this transaction ends, then falls through to the winner's row below.
+    doc = (
+        await db.scalars(
+            pg_insert(Document)
+            .values(
+                id=document_id,
+                filename=safe_name,
+                storage_key=storage_key,
+                checksum_sha256=checksum_sha256,
+                version=version,
+                total_pages=0,
+            )
+            .on_conflict_do_nothing()
+            .returning(Document)
         )
+    ).first()
+    if doc is None:
+        existing_doc = await _existing_document_for_upload(db, checksum_sha256, storage_key)
         await file.close()
-        return existing_storage_doc
-
-    doc = Document(
-        id=document_id,
-        filename=safe_name,
-        storage_key=storage_key,
-        checksum_sha256=checksum_sha256,
-        version=version,
-        total_pages=0,
-    )
+        if existing_doc is None:
+            # The conflicting row was deleted between the insert and the lookup.
+            raise HTTPException(status_code=409, detail="Upload conflicted with a concurrent change. Please retry.")
+        if existing_doc.checksum_sha256 == checksum_sha256:
+            logger.info(
+                "upload_deduped request_id=%s checksum=%s existing_document_id=%s version=%s",
+                request_id,
+                checksum_sha256,
+                existing_doc.id,
+                existing_doc.version,
+            )
+        else:
+            logger.info(
+                "upload_deduped_storage_key request_id=%s storage_key=%s existing_document_id=%s",
+                request_id,
+                storage_key,
+                existing_doc.id,
+            )
+        return existing_doc
 
+    # Use document_id, not doc.id, below: the rollback in the except branches expires doc, and
+    # touching an expired attribute under AsyncSession raises instead of lazy loading.
     file_uploaded = False
     try:
         logger.info(
             "upload_start request_id=%s document_id=%s checksum=%s version=%s storage_key=%s",
             request_id,
-            doc.id,
+            document_id,
             checksum_sha256,
             version,
             storage_key,
         )
-        await run_in_threadpool(storage_service.upload_file, file_bytes, storage_key, "application/pdf")
-        file_uploaded = True
-
-        total_pages, pages_data = await parse_pdf(file_bytes, str(doc.id))
+        # The PUT is network-bound and parsing is CPU-bound, so run them side by side. Parsing
+        # reads through its own mmap, leaving the file offset to the upload.
+        upload_task = asyncio.create_task(
+            run_in_threadpool(storage_service.upload_file, spool, storage_key, "application/pdf")
+        )
+        try:
+            total_pages, pages_data = await parse_pdf(spool, str(document_id))
+        finally:
+            # Always let the upload settle so the cleanup below knows whether the object landed.
+            await asyncio.wait([upload_task])
+            file_uploaded = not upload_task.cancelled() and upload_task.exception() is None
+        upload_task.result()
         doc.total_pages = total_pages
 
-        db.add(doc)
-        for pd in pages_data:
-            db.add(
-                DocumentPage(
-                    document_id=doc.id,
-                    page_number=pd["page_number"],
-                    text=pd["text"],
-                    text_quality_score=pd["text_quality_score"],
-                    page_image_key=pd["page_image_key"],
-                )
+        if pages_data:
+            await db.execute(
+                insert(DocumentPage),
+                [
+                    {
+                        "document_id": document_id,
+                        "page_number": pd["page_number"],
+                        "text": pd["text"],
+                        "text_quality_score": pd["text_quality_score"],
+                        "page_image_key": pd["page_image_key"],
+                    }
+                    for pd in pages_data
+                ],
             )
         await db.commit()
-        await db.refresh(doc)
     except ValueError as exc:
         await db.rollback()
         if file_uploaded:
             await run_in_threadpool(storage_service.delete_files, [storage_key])
-        logger.warning("upload_rejected request_id=%s document_id=%s reason=%s", request_id, doc.id, exc)
+        logger.warning("upload_rejected request_id=%s document_id=%s reason=%s", request_id, document_id, exc)
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except Exception as exc:
         await db.rollback()
         if file_uploaded:
             await run_in_threadpool(storage_service.delete_files, [storage_key])
-        logger.exception("document_upload_failed request_id=%s document_id=%s error=%s", request_id, doc.id, exc)
+        logger.exception("document_upload_failed request_id=%s document_id=%s error=%s", request_id, document_id, exc)
         raise HTTPException(status_code=500, detail="Failed to parse PDF document.") from exc
     finally:
         await file.close()
@@ -259,10 +353,19 @@ async def upload_document(
     request: Request,
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    x_content_sha256: str | None = Header(
+        default=None,
+        description="Optional hex SHA-256 of the file; known digests are deduplicated without hashing the body.",
+    ),
     db: AsyncSession = Depends(get_db),
 ):
     request_id = getattr(request.state, "request_id", None)
-    document = await _ingest_pdf_upload(request_id=request_id, file=file, db=db)
+    document = await _ingest_pdf_upload(
+        request_id=request_id,
+        file=file,
+        db=db,
+        claimed_checksum=x_content_sha256,
+    )
     pipeline_job_id = await _queue_pipeline(
         request_id=request_id,
         document_id=document.id,
@@ -291,30 +394,35 @@ async def batch_upload_documents(
     request: Request,
     background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
-    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(get_session_factory),
 ):
     request_id = getattr(request.state, "request_id", None)
     if not files:
         raise HTTPException(status_code=400, detail="No files were uploaded.")
 
-    responses: list[UploadDocumentResponse] = []
-    for upload in files:
-        document = await _ingest_pdf_upload(request_id=request_id, file=upload, db=db)
-        pipeline_job_id = await _queue_pipeline(
-            request_id=request_id,
-            document_id=document.id,
-            background_tasks=background_tasks,
-            db=db,
-        )
-        status_map = await compute_document_statuses(db, [document.id])
-        responses.append(
-            _to_upload_response(
+    # Each file gets its own session because one AsyncSession cannot be awaited concurrently;
+    # each is closed before the handler returns.
+    async def _ingest_one(upload: UploadFile) -> UploadDocumentResponse:
+        async with BATCH_UPLOAD_SLOTS, session_factory() as db:
+            document = await _ingest_pdf_upload(request_id=request_id, file=upload, db=db)
+            pipeline_job_id = await _queue_pipeline(
+                request_id=request_id,
+                document_id=document.id,
+                background_tasks=background_tasks,
+                db=db,
+            )
+            status_map = await compute_document_statuses(db, [document.id])
+            return _to_upload_response(
                 document,
                 status_value=status_map.get(document.id, DOCUMENT_STATUS_UPLOADED),
                 pipeline_job_id=pipeline_job_id,
             )
-        )
-    return responses
+
+    results = await asyncio.gather(*(_ingest_one(upload) for upload in files), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
 
 
 @router.get("/documents", response_model=List[DocumentResponse], summary="List uploaded documents")
@@ -323,8 +431,8 @@ async def list_documents(
     limit: int = Query(default=50, ge=1, le=200, description="Page size."),
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(select(Document).order_by(Document.created_at.desc()).offset(skip).limit(limit))
-    documents = result.scalars().all()
+    result = await db.execute(LIST_DOCUMENTS_STMT.offset(skip).limit(limit))
+    documents = result.all()
     status_map = await compute_document_statuses(db, [document.id for document in documents])
     return [_to_document_response(document, status_map.get(document.id, DOCUMENT_STATUS_UPLOADED)) for document in documents]
 
@@ -429,6 +537,19 @@ async def download_document(document_id: UUID, request: Request, db: AsyncSessio
     return DownloadDocumentResponse(url=signed_url, filename=doc.filename)
 
 
+def _cleanup_document_storage(storage_paths: list[str], request_id: str | None, document_id: UUID) -> None:
+    """Background task: remove a deleted document's objects; the rows are already gone."""
+    try:
+        storage_service.delete_files(storage_paths)
+    except Exception as exc:
+        logger.warning(
+            "document_delete_storage_cleanup_failed request_id=%s document_id=%s error=%s",
+            request_id,
+            document_id,
+            exc,
+        )
+
+
 @router.delete(
     "/documents/{document_id}",
     status_code=204,
@@ -436,30 +557,36 @@ async def download_document(document_id: UUID, request: Request, db: AsyncSessio
     summary="Delete a document and all dependent rows (pages/jobs/extractions/embeddings)",
     responses={404: {"model": ErrorResponse, "description": "Document not found"}},
 )
-async def delete_document(document_id: UUID, request: Request, db: AsyncSession = Depends(get_db)):
+async def delete_document(
+    document_id: UUID,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+):
     request_id = getattr(request.state, "request_id", None)
-    doc = (
+    # Page keys have to be read first: the cascade removes the page rows with the document.
+    page_image_keys = (
         await db.execute(
-            select(Document).options(selectinload(Document.pages)).where(Document.id == document_id)
+            select(DocumentPage.page_image_key).where(
+                DocumentPage.document_id == document_id,
+                DocumentPage.page_image_key.is_not(None),
+            )
         )
-    ).scalars().first()
-    if not doc:
+    ).scalars().all()
+
+    # Pages, jobs, extractions and embeddings go with it via ON DELETE CASCADE.
+    storage_key = (
+        await db.execute(delete(Document).where(Document.id == document_id).returning(Document.storage_key))
+    ).scalar_one_or_none()
+    if storage_key is None:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Document not found")
+    await db.commit()
+    retrieval_cache.invalidate()
 
-    storage_paths = [doc.storage_key] + [page.page_image_key for page in doc.pages if page.page_image_key]
+    storage_paths = [key for key in (storage_key, *page_image_keys) if key]
     if storage_paths:
-        try:
-            await run_in_threadpool(storage_service.delete_files, storage_paths)
-        except Exception as exc:
-            logger.warning(
-                "document_delete_storage_cleanup_failed request_id=%s document_id=%s error=%s",
-                request_id,
-                document_id,
-                exc,
-            )
+        background_tasks.add_task(_cleanup_document_storage, storage_paths, request_id, document_id)
 
-    await db.execute(delete(Embedding).where(Embedding.document_id == document_id))
-    await db.delete(doc)
-    await db.commit()
     logger.info("document_deleted request_id=%s document_id=%s", request_id, document_id)
     return Response(status_code=204)
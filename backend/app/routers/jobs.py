@@ -1,13 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
+from app.core.config import settings
+from app.core.ttl_cache import TTLCache
 from app.db.database import get_db
 from app.db.models import Job
 from app.schemas.api import ErrorResponse, JobResponse
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
+# Clients poll job status every second or two; serve repeat polls from memory for a short TTL.
+job_status_cache = TTLCache(settings.job_status_cache_ttl_s)
+
 @router.get(
     "/{job_id}",
     response_model=JobResponse,
@@ -15,7 +21,11 @@ router = APIRouter(prefix="/jobs", tags=["jobs"])
     responses={404: {"model": ErrorResponse, "description": "Job not found"}},
 )
 async def get_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
-    job = await db.get(Job, job_id)
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    return job
+    body = job_status_cache.get(job_id)
+    if body is None:
+        job = await db.get(Job, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        body = JobResponse.model_validate(job).model_dump_json()
+        job_status_cache.set(job_id, body)
+    return Response(content=body, media_type="application/json")
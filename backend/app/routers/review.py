@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
@@ -20,17 +21,22 @@ async def submit_review(extraction_id: UUID, req: ReviewEditRequest, db: AsyncSe
     if not extraction:
         raise HTTPException(status_code=404, detail="Extraction not found")
         
-    edit = ReviewEdit(
-        extraction_id=extraction.id,
-        original_data=extraction.data,
-        updated_data=req.updated_data,
-        edited_by=req.edited_by
-    )
-    db.add(edit)
+    # RETURNING hands back the server-generated created_at, so no refresh round trip after commit.
+    edit = (
+        await db.scalars(
+            insert(ReviewEdit)
+            .values(
+                extraction_id=extraction.id,
+                original_data=extraction.data,
+                updated_data=req.updated_data,
+                edited_by=req.edited_by,
+            )
+            .returning(ReviewEdit)
+        )
+    ).one()
 
     extraction.data = req.updated_data
 
     await db.commit()
-    await db.refresh(edit)
 
     return edit
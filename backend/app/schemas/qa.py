@@ -3,6 +3,9 @@ from uuid import UUID
 
 from pydantic import AliasChoices, BaseModel, ConfigDict, Field, field_validator
 
+# Upper bound on the scope list, so a single request cannot make validation and the IN (...) filter unbounded.
+MAX_ASK_DOC_IDS = 256
+
 class AskRequest(BaseModel):
     model_config = ConfigDict(
         populate_by_name=True,
@@ -24,6 +27,7 @@ class AskRequest(BaseModel):
     doc_ids: Optional[List[UUID]] = Field(
         default=None,
         validation_alias=AliasChoices("doc_ids", "document_ids"),
+        max_length=MAX_ASK_DOC_IDS,
         description="Optional list of document IDs to scope retrieval. If omitted, searches all embedded documents.",
     )
 
@@ -32,6 +36,7 @@ class AskRequest(BaseModel):
     def dedupe_doc_ids(cls, value: Optional[List[UUID]]) -> Optional[List[UUID]]:
         if not value:
             return value
+        # dict.fromkeys is a single C-level pass that keeps first-seen order.
         return list(dict.fromkeys(value))
 
 class Citation(BaseModel):
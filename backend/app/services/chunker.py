@@ -2,11 +2,18 @@ import re
 from dataclasses import dataclass
 
 from app.core.config import settings
-from app.utils.tokens import count_tokens
+from app.utils.tokens import count_tokens, count_tokens_batch
 
-GLOSSARY_LINE_RE = re.compile(r"^(?:[A-Z][A-Z0-9/().-]{1,15})\s+.+")
-HEADING_RE = re.compile(r"^(?:\d+(?:\.\d+)*)\s+[A-Z].+$")
-BULLET_RE = re.compile(r"^[\u2022\-*]\s+")
+# One pass classifies a line. The kinds start with a digit, a capital letter and a bullet mark
+# respectively, so at most one alternative can match.
+LINE_KIND_RE = re.compile(
+    r"^(?:"
+    r"(?P<heading>\d+(?:\.\d+)*\s+[A-Z].+$)"
+    r"|(?P<glossary>[A-Z][A-Z0-9/().-]{1,15}\s+.+)"
+    r"|(?P<bullet>[\u2022\-*]\s+)"
+    r")"
+)
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
 
 
 @dataclass(frozen=True)
@@ -16,9 +23,13 @@ class TextChunk:
 
 
 def _clean_line(line: str) -> str:
-    line = line.replace("\u00a0", " ")
-    line = re.sub(r"\s+", " ", line).strip()
-    return line
+    # str.split() collapses the same Unicode whitespace as \s+, in C.
+    return " ".join(line.replace("\u00a0", " ").split())
+
+
+def _line_kind(line: str) -> str | None:
+    match = LINE_KIND_RE.match(line)
+    return match.lastgroup if match else None
 
 
 def _split_into_blocks(text: str) -> list[str]:
@@ -29,31 +40,34 @@ def _split_into_blocks(text: str) -> list[str]:
 
     blocks: list[list[str]] = []
     current: list[str] = []
+    # Whether current[-1] is a glossary or bullet line, tracked instead of re-matching it.
+    current_is_list = False
 
     for line in lines:
-        is_heading = bool(HEADING_RE.match(line))
-        is_glossary = bool(GLOSSARY_LINE_RE.match(line))
-        is_bullet = bool(BULLET_RE.match(line))
+        kind = _line_kind(line)
 
-        if is_heading:
+        if kind == "heading":
             if current:
                 blocks.append(current)
                 current = []
             blocks.append([line])
+            current_is_list = False
             continue
 
-        if is_glossary or is_bullet:
-            if current and not GLOSSARY_LINE_RE.match(current[-1]) and not BULLET_RE.match(current[-1]):
+        if kind is not None:
+            if current and not current_is_list:
                 blocks.append(current)
                 current = []
             current.append(line)
+            current_is_list = True
             continue
 
-        if current and (GLOSSARY_LINE_RE.match(current[-1]) or BULLET_RE.match(current[-1])):
+        if current and current_is_list:
             blocks.append(current)
             current = []
 
         current.append(line)
+        current_is_list = False
 
     if current:
         blocks.append(current)
@@ -62,16 +76,13 @@ def _split_into_blocks(text: str) -> list[str]:
 
 
 def _split_large_block(block: str, chunk_size: int) -> list[str]:
-    sentences = re.split(r"(?<=[.!?])\s+", block)
+    sentences = [sentence.strip() for sentence in SENTENCE_SPLIT_RE.split(block)]
+    sentences = [sentence for sentence in sentences if sentence]
     out: list[str] = []
     current: list[str] = []
     current_tokens = 0
 
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-        sentence_tokens = count_tokens(sentence)
+    for sentence, sentence_tokens in zip(sentences, count_tokens_batch(sentences)):
 
         if sentence_tokens > chunk_size:
             words = sentence.split()
@@ -122,7 +133,8 @@ def chunk_text(
         return []
 
     chunks: list[TextChunk] = []
-    current_blocks: list[str] = []
+    # (block, token count) pairs so building the overlap never re-tokenizes a block.
+    current_blocks: list[tuple[str, int]] = []
     current_tokens = 0
 
     def flush() -> None:
@@ -130,40 +142,39 @@ def chunk_text(
         if not current_blocks:
             return
 
-        content = "\n".join(current_blocks).strip()
+        content = "\n".join(block for block, _ in current_blocks).strip()
         if content:
             chunks.append(TextChunk(content=content, approx_tokens=current_tokens))
 
-        overlap_blocks: list[str] = []
+        overlap_blocks: list[tuple[str, int]] = []
         overlap_tokens = 0
-        for block in reversed(current_blocks):
-            block_tokens = count_tokens(block)
+        for block, block_tokens in reversed(current_blocks):
             if overlap_tokens + block_tokens > chunk_overlap:
                 break
-            overlap_blocks.insert(0, block)
+            overlap_blocks.append((block, block_tokens))
             overlap_tokens += block_tokens
+        overlap_blocks.reverse()
 
         current_blocks = overlap_blocks
         current_tokens = overlap_tokens
 
-    for block in blocks:
-        block_tokens = count_tokens(block)
+    for block, block_tokens in zip(blocks, count_tokens_batch(blocks)):
 
         if block_tokens > chunk_size:
             flush()
-            for segment in _split_large_block(block, chunk_size):
-                seg_tokens = count_tokens(segment)
+            segments = _split_large_block(block, chunk_size)
+            for segment, seg_tokens in zip(segments, count_tokens_batch(segments)):
                 chunks.append(TextChunk(content=segment, approx_tokens=seg_tokens))
             continue
 
         if current_blocks and current_tokens + block_tokens > chunk_size:
             flush()
 
-        current_blocks.append(block)
+        current_blocks.append((block, block_tokens))
         current_tokens += block_tokens
 
     if current_blocks:
-        content = "\n".join(current_blocks).strip()
+        content = "\n".join(block for block, _ in current_blocks).strip()
         if content:
             chunks.append(TextChunk(content=content, approx_tokens=current_tokens))
 
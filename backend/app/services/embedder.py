@@ -1,16 +1,12 @@
 import math
 
-from openai import AsyncOpenAI
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from app.core.config import settings
 from app.core.logging import get_request_id, logger
+from app.services.openai_client import openai_client
 
-openai_client = AsyncOpenAI(
-    api_key=settings.openai_api_key,
-    timeout=settings.llm_timeout_s,
-    max_retries=settings.llm_retries,
-)
+UNIT_NORM_TOLERANCE = 1e-6
 
 @retry(
     stop=stop_after_attempt(settings.llm_retries + 1),
@@ -37,8 +33,9 @@ async def generate_embeddings(texts: list[str], request_id: str | None = None) -
                 raise ValueError(
                     f"Embedding dimension mismatch. expected={settings.openai_embed_dims} got={len(emb)}"
                 )
-            norm = math.sqrt(sum(v * v for v in emb))
-            if norm == 0:
+            norm = math.sqrt(math.sumprod(emb, emb))
+            if norm == 0 or math.isclose(norm, 1.0, abs_tol=UNIT_NORM_TOLERANCE):
+                # OpenAI already returns unit-length vectors, so rescaling is usually a no-op.
                 vectors.append(emb)
             else:
                 vectors.append([v / norm for v in emb])
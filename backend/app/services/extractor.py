@@ -1,20 +1,17 @@
 import instructor
-from openai import AsyncOpenAI
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from app.core.config import settings
 from app.core.logging import logger
 from app.schemas.extraction import ExtractionSchema
+from app.services.openai_client import openai_client
 
 # Setup instructor with async client
-client = instructor.from_openai(
-    AsyncOpenAI(
-        api_key=settings.openai_api_key,
-        timeout=settings.llm_timeout_s,
-        max_retries=settings.llm_retries,
-    ),
-    mode=instructor.Mode.TOOLS
-)
+client = instructor.from_openai(openai_client, mode=instructor.Mode.TOOLS)
+
+# Wrap once: instructor rebuilds a subclass of a plain model on every call, which also misses its
+# schema cache. A pre-wrapped model is passed through and its tool schema is generated once.
+EXTRACTION_RESPONSE_MODEL = instructor.openai_schema(ExtractionSchema)
 
 @retry(
     stop=stop_after_attempt(settings.llm_retries + 1),
@@ -26,7 +23,7 @@ async def extract_document_features(text: str) -> ExtractionSchema:
     try:
         extraction = await client.chat.completions.create(
             model=settings.chat_model,
-            response_model=ExtractionSchema,
+            response_model=EXTRACTION_RESPONSE_MODEL,
             max_tokens=4000,
             messages=[
                 {"role": "system", "content": "You are a highly capable document extraction system. Extracted information must exactly match the document. Do not hallucinate."},
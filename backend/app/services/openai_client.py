@@ -0,0 +1,11 @@
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+
+# One client per process: chat, vision, embedding and extraction calls share its connection pool,
+# so keep-alive connections and TLS sessions are reused across services.
+openai_client = AsyncOpenAI(
+    api_key=settings.openai_api_key,
+    timeout=settings.llm_timeout_s,
+    max_retries=settings.llm_retries,
+)
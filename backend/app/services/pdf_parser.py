@@ -1,52 +1,103 @@
+import asyncio
 import base64
-from typing import Any
+import json
+import mmap
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any, BinaryIO
 
-import fitz  # PyMuPDF
 from fastapi.concurrency import run_in_threadpool
-from openai import AsyncOpenAI
 
 from app.core.config import settings
 from app.core.logging import get_request_id, logger
+from app.services.openai_client import openai_client
 from app.services.supabase_storage import storage_service
 
 LOW_TEXT_THRESHOLD = 100
+# Sparse pages kept as extracted text because the document as a whole is text-based.
+SPARSE_TEXT_QUALITY_SCORE = 0.9
+# Low-text pages are rasterized for the vision model; JPEG encodes far faster than PNG's DEFLATE.
+PAGE_IMAGE_DPI = 120
+PAGE_IMAGE_JPEG_QUALITY = 85
+PAGE_QUEUE_SIZE = 8
+# gpt-4o-mini caps a completion at 16k tokens, which bounds how much text a batched vision answer can carry.
+VISION_BATCH_MAX_TOKENS = 16000
+VISION_BATCH_SCHEMA = {
+    "name": "page_texts",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {"pages": {"type": "array", "items": {"type": "string"}}},
+        "required": ["pages"],
+        "additionalProperties": False,
+    },
+}
+_END_OF_PAGES = object()
 
-openai_client = AsyncOpenAI(
-    api_key=settings.openai_api_key,
-    timeout=settings.llm_timeout_s,
-    max_retries=settings.llm_retries,
-)
 
+def _render_page_image(doc: Any, index: int) -> bytes:
+    """
+    Render one page to JPEG bytes. Kept in its own scope so the page and the raw pixmap are
+    released here rather than staying referenced by the suspended page generator.
+    """
+    import fitz
+
+    # Grayscale is one byte per pixel instead of three and reads the same to the vision model.
+    pixmap = doc[index].get_pixmap(dpi=PAGE_IMAGE_DPI, colorspace=fitz.csGRAY, alpha=False)
+    return pixmap.tobytes("jpeg", jpg_quality=PAGE_IMAGE_JPEG_QUALITY)
 
-def _extract_pages_sync(file_bytes: bytes) -> tuple[int, list[dict[str, Any]]]:
+
+def _iter_pages_sync(pdf_file: BinaryIO, document_id: str, request_id: str | None) -> Iterator[dict[str, Any]]:
     """
-    Run CPU-heavy PDF parsing in a worker thread so the event loop stays responsive.
+    Yield parsed pages one at a time; runs CPU-heavy PDF parsing in a worker thread.
+    The file is mapped read-only, so MuPDF reads pages straight from the page cache.
     """
-    doc = fitz.open("pdf", file_bytes)
-    total_pages = len(doc)
-    pages_data: list[dict[str, Any]] = []
+    import fitz  # PyMuPDF; imported lazily so routers load without it
 
-    for i, page in enumerate(doc):
-        page_number = i + 1
-        text = page.get_text()
-        image_bytes = None
+    with mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer, memoryview(buffer) as view:
+        doc = fitz.open("pdf", view)
+        try:
+            total_pages = len(doc)
+            if total_pages > settings.max_pages:
+                raise ValueError(f"PDF has {total_pages} pages, exceeds max of {settings.max_pages}.")
 
-        if len(text.strip()) < LOW_TEXT_THRESHOLD:
-            pix = page.get_pixmap(dpi=150)
-            image_bytes = pix.tobytes("png")
+            # Text extraction is cheap, so read every page first and decide once for the whole document:
+            # in a mostly born-digital PDF, the few sparse pages are figures or blanks, not scans.
+            started_at = time.perf_counter()
+            texts = [page.get_text() for page in doc]
+            sparse = [len(text.strip()) < LOW_TEXT_THRESHOLD for text in texts]
+            text_ratio = 1.0 - sum(sparse) / total_pages if total_pages else 1.0
+            use_vision = any(sparse) and text_ratio < settings.pdf_vision_confidence_threshold
+            logger.info(
+                "pdf_route request_id=%s document_id=%s route=%s text_ratio=%.2f sparse_pages=%s duration_ms=%.2f",
+                request_id,
+                document_id,
+                "vision_fallback" if use_vision else "local_text",
+                text_ratio,
+                sum(sparse),
+                (time.perf_counter() - started_at) * 1000,
+            )
 
-        pages_data.append(
-            {
-                "page_number": page_number,
-                "text": text,
-                "text_quality_score": 1.0,
-                "page_image_key": None,
-                "image_bytes": image_bytes,
-            }
-        )
+            for i, text in enumerate(texts):
+                image_bytes = None
+                text_quality_score = 1.0
+                if sparse[i]:
+                    if use_vision:
+                        image_bytes = _render_page_image(doc, i)
+                    else:
+                        text_quality_score = SPARSE_TEXT_QUALITY_SCORE
+
+                yield {
+                    "page_number": i + 1,
+                    "text": text,
+                    "text_quality_score": text_quality_score,
+                    "page_image_key": None,
+                    "image_bytes": image_bytes,
+                }
+        finally:
+            doc.close()
 
-    doc.close()
-    return total_pages, pages_data
 
 async def _extract_text_via_vision(image_bytes: bytes) -> str:
     """Fallback: extract text from an image using gpt-4o-mini Vision."""
@@ -61,7 +112,7 @@ async def _extract_text_via_vision(image_bytes: bytes) -> str:
                     {"type": "text", "text": "Extract all the text from this document image. Return ONLY the text, nothing else."},
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{base64_image}"},
+                        "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
                     },
                 ],
             }
@@ -70,43 +121,137 @@ async def _extract_text_via_vision(image_bytes: bytes) -> str:
     )
     return response.choices[0].message.content or ""
 
-async def parse_pdf(file_bytes: bytes, document_id: str):
+
+async def _extract_text_via_vision_batch(images: list[bytes]) -> list[str]:
+    """Extract text from several page images in one request; returns one string per image, in order."""
+    if len(images) == 1:
+        return [await _extract_text_via_vision(images[0])]
+
+    content: list[dict[str, Any]] = [
+        {
+            "type": "text",
+            "text": (
+                f"Extract all the text from each of these {len(images)} document images. "
+                "Return one entry per image, in the order given, containing ONLY that image's text."
+            ),
+        },
+        *(
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{base64.b64encode(image).decode('utf-8')}"},
+            }
+            for image in images
+        ),
+    ]
+    response = await openai_client.chat.completions.create(
+        model=settings.chat_model,
+        messages=[{"role": "user", "content": content}],
+        response_format={"type": "json_schema", "json_schema": VISION_BATCH_SCHEMA},
+        max_tokens=min(2000 * len(images), VISION_BATCH_MAX_TOKENS),
+    )
+    try:
+        texts = json.loads(response.choices[0].message.content or "")["pages"]
+    except (ValueError, KeyError, TypeError):
+        texts = None
+    if isinstance(texts, list) and len(texts) == len(images) and all(isinstance(text, str) for text in texts):
+        return texts
+
+    # The batch answer cannot be mapped back to pages reliably; redo them one at a time.
+    logger.warning("vision_batch_mismatch request_id=%s images=%s", get_request_id(), len(images))
+    return [await _extract_text_via_vision(image) for image in images]
+
+
+async def _apply_vision_fallback(batch: list[dict[str, Any]], document_id: str, request_id: str | None) -> None:
+    images = [page_data.pop("image_bytes") for page_data in batch]
+    logger.info(
+        "vision_fallback request_id=%s pages=%s document_id=%s reason=low_text model=%s",
+        request_id,
+        ",".join(str(page_data["page_number"]) for page_data in batch),
+        document_id,
+        settings.chat_model,
+    )
+    # Image keys are deterministic, so uploads run alongside the vision request instead of after it.
+    uploads = []
+    for page_data, image_bytes in zip(batch, images):
+        page_image_key = f"{document_id}/pages/page_{page_data['page_number']}.jpg"
+        uploads.append(run_in_threadpool(storage_service.upload_file, image_bytes, page_image_key, "image/jpeg"))
+        page_data["page_image_key"] = page_image_key
+    vision_texts, _ = await asyncio.gather(_extract_text_via_vision_batch(images), asyncio.gather(*uploads))
+
+    for page_data, vision_text in zip(batch, vision_texts):
+        if vision_text.strip():
+            page_data["text"] = vision_text
+        page_data["text_quality_score"] = 0.8
+
+
+async def parse_pdf(pdf_file: BinaryIO, document_id: str):
     """
     Parse PDF into pages. Returns list of dictionaries containing page data.
     dict: page_number, text, text_quality_score, page_image_key
     """
     request_id = get_request_id()
     logger.info("parse_pdf_start request_id=%s document_id=%s", request_id, document_id)
-    total_pages, pages_data = await run_in_threadpool(_extract_pages_sync, file_bytes)
-
-    if total_pages > settings.max_pages:
-        raise ValueError(f"PDF has {total_pages} pages, exceeds max of {settings.max_pages}.")
-
-    for page_data in pages_data:
-        image_bytes = page_data.pop("image_bytes", None)
-        if image_bytes is None:
-            continue
-
-        page_number = page_data["page_number"]
-        logger.info(
-            "vision_fallback request_id=%s page=%s document_id=%s reason=low_text model=%s",
-            request_id,
-            page_number,
-            document_id,
-            settings.chat_model,
-        )
-        vision_text = await _extract_text_via_vision(image_bytes)
-        if vision_text.strip():
-            page_data["text"] = vision_text
-        page_data["text_quality_score"] = 0.8
-        page_image_key = f"{document_id}/pages/page_{page_number}.png"
-        await run_in_threadpool(
-            storage_service.upload_file,
-            image_bytes,
-            page_image_key,
-            "image/png",
-        )
-        page_data["page_image_key"] = page_image_key
 
+    # The parser thread feeds a bounded queue, so low-text pages go to vision while later pages
+    # are still being parsed, and only a handful of rendered page images are alive at once.
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=PAGE_QUEUE_SIZE)
+    stop = threading.Event()
+
+    def _put(item: Any) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def _produce() -> None:
+        try:
+            for page_data in _iter_pages_sync(pdf_file, document_id, request_id):
+                if stop.is_set():
+                    break
+                _put(page_data)
+        finally:
+            _put(_END_OF_PAGES)
+
+    # Low-text pages are grouped into batches of vision_batch_size per vision request. Batches and
+    # their image uploads overlap up to vision_concurrency; the slot is taken before the task is
+    # spawned so rendered page images cannot pile up behind the semaphore.
+    vision_slots = asyncio.Semaphore(settings.vision_concurrency)
+
+    async def _vision_task(batch: list[dict[str, Any]]) -> None:
+        try:
+            await _apply_vision_fallback(batch, document_id, request_id)
+        finally:
+            vision_slots.release()
+
+    async def _dispatch(batch: list[dict[str, Any]]) -> None:
+        await vision_slots.acquire()
+        vision_tasks.append(asyncio.create_task(_vision_task(batch)))
+
+    producer = asyncio.ensure_future(run_in_threadpool(_produce))
+    pages_data: list[dict[str, Any]] = []
+    vision_tasks: list[asyncio.Task[None]] = []
+    pending_batch: list[dict[str, Any]] = []
+    drained = False
+    try:
+        while (page_data := await queue.get()) is not _END_OF_PAGES:
+            pages_data.append(page_data)
+            if page_data.get("image_bytes") is not None:
+                pending_batch.append(page_data)
+                if len(pending_batch) == settings.vision_batch_size:
+                    await _dispatch(pending_batch)
+                    pending_batch = []
+        drained = True
+        if pending_batch:
+            await _dispatch(pending_batch)
+        await asyncio.gather(*vision_tasks)
+    finally:
+        for task in vision_tasks:
+            task.cancel()
+        if not drained:
+            # Unblock a parser thread waiting on the full queue so it can exit.
+            stop.set()
+            while await queue.get() is not _END_OF_PAGES:
+                pass
+    await producer
+
+    total_pages = len(pages_data)
     logger.info("parse_pdf_complete request_id=%s document_id=%s total_pages=%s", request_id, document_id, total_pages)
     return total_pages, pages_data
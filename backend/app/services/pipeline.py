@@ -1,107 +1,178 @@
 import asyncio
 import time
+from contextlib import aclosing
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any
+from typing import Annotated, Any
 from uuid import UUID
 
-from sqlalchemy import select
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
+from sqlalchemy import ColumnElement, exists, func, literal, select, text, update
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from app.core.logging import logger
-from app.db.database import AsyncSessionLocal
-from app.db.models import Embedding, Extraction, Job
+from app.db.database import JobSessionLocal, jobs_engine
+from app.db.models import Embedding, Extraction, Job, utc_timestamp
 
 PIPELINE_TASK_TYPE = "pipeline"
 ACTIVE_JOB_STATUSES = {"queued", "processing"}
 EXTRACT_SUCCESS_STATUSES = {"done", "needs_review"}
 EMBED_SUCCESS_STATUSES = {"done"}
+JOB_WAIT_FALLBACK_POLL_SECONDS = 5.0
 
 
 def _utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def _object_or_empty(value: Any) -> Any:
+    # Metadata is free-form JSONB; a malformed section is reset rather than failing the job.
+    return value if isinstance(value, dict) else {}
+
+
+class StepMeta(BaseModel):
+    model_config = ConfigDict(extra="ignore", coerce_numbers_to_str=True)
+
+    status: str = "queued"
+    job_id: str | None = None
+    error_message: str | None = None
+    updated_at: str | None = None
+
+
+class PipelineStepsMeta(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    extract: Annotated[StepMeta, BeforeValidator(_object_or_empty)] = Field(default_factory=StepMeta)
+    embed: Annotated[StepMeta, BeforeValidator(_object_or_empty)] = Field(default_factory=StepMeta)
+
+
+class PipelineMeta(BaseModel):
+    # Keep started_at/completed_at/failed_at and any other top-level keys as they are.
+    model_config = ConfigDict(extra="allow")
+
+    steps: Annotated[PipelineStepsMeta, BeforeValidator(_object_or_empty)] = Field(default_factory=PipelineStepsMeta)
+
+
 def _normalize_pipeline_metadata(raw: Any) -> dict[str, Any]:
-    metadata = raw if isinstance(raw, dict) else {}
-    steps = metadata.get("steps")
-    if not isinstance(steps, dict):
-        steps = {}
-    extract_step = steps.get("extract")
-    embed_step = steps.get("embed")
-    if not isinstance(extract_step, dict):
-        extract_step = {}
-    if not isinstance(embed_step, dict):
-        embed_step = {}
-    metadata["steps"] = {
-        "extract": {
-            "status": str(extract_step.get("status", "queued")),
-            "job_id": extract_step.get("job_id"),
-            "error_message": extract_step.get("error_message"),
-            "updated_at": extract_step.get("updated_at"),
-        },
-        "embed": {
-            "status": str(embed_step.get("status", "queued")),
-            "job_id": embed_step.get("job_id"),
-            "error_message": embed_step.get("error_message"),
-            "updated_at": embed_step.get("updated_at"),
-        },
-    }
-    return metadata
-
-
-async def _latest_job(
-    db: AsyncSession,
-    document_id: UUID,
-    task_type: str,
-    statuses: set[str] | None = None,
-) -> Job | None:
-    stmt = select(Job).where(Job.document_id == document_id, Job.task_type == task_type)
-    if statuses:
-        stmt = stmt.where(Job.status.in_(sorted(statuses)))
-    result = await db.execute(stmt.order_by(Job.created_at.desc()).limit(1))
-    return result.scalars().first()
+    return PipelineMeta.model_validate(_object_or_empty(raw)).model_dump()
+
+
+def _merged_metadata(**values: Any) -> ColumnElement[Any]:
+    # Merge keys into task_metadata inside the UPDATE, so a status transition needs no read first.
+    patch = func.jsonb_build_object(*(item for pair in values.items() for item in pair))
+    return func.coalesce(Job.task_metadata, func.jsonb_build_object()).op("||", return_type=JSONB)(patch)
+
+
+@dataclass(frozen=True)
+class PipelineSnapshot:
+    extraction_exists: bool
+    embedding_exists: bool
+    # Most recent queued/processing pipeline job, else the most recent done one.
+    pipeline_job: Job | None
+    latest_extract_job_id: UUID | None
+    latest_embed_job_id: UUID | None
+    latest_embed_status: str | None
 
+    @property
+    def embedding_complete(self) -> bool:
+        return self.latest_embed_status == "done" or self.embedding_exists
 
-async def _has_extraction(db: AsyncSession, document_id: UUID) -> bool:
-    result = await db.execute(select(Extraction.id).where(Extraction.document_id == document_id).limit(1))
-    return result.scalar_one_or_none() is not None
 
+def _latest_job_column(column: Any, document_id: UUID, task_type: str) -> ColumnElement[Any]:
+    return (
+        select(column)
+        .where(Job.document_id == document_id, Job.task_type == task_type)
+        .order_by(Job.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
 
-async def _is_embedding_complete(db: AsyncSession, document_id: UUID) -> bool:
-    latest_embed_job = await _latest_job(db, document_id, task_type="embed")
-    if latest_embed_job and latest_embed_job.status == "done":
-        return True
-    result = await db.execute(select(Embedding.id).where(Embedding.document_id == document_id).limit(1))
-    return result.scalar_one_or_none() is not None
+
+async def _get_pipeline_snapshot(db: AsyncSession, document_id: UUID) -> PipelineSnapshot:
+    """Step outputs and latest job pointers for a document, read in a single round trip."""
+    pipeline_job = aliased(Job)
+    pipeline_job_id = (
+        select(Job.id)
+        .where(
+            Job.document_id == document_id,
+            Job.task_type == PIPELINE_TASK_TYPE,
+            Job.status.in_(sorted(ACTIVE_JOB_STATUSES | {"done"})),
+        )
+        .order_by(Job.status.in_(sorted(ACTIVE_JOB_STATUSES)).desc(), Job.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    anchor = select(literal(1).label("anchor")).subquery()
+    stmt = (
+        select(
+            exists().where(Extraction.document_id == document_id).label("extraction_exists"),
+            exists().where(Embedding.document_id == document_id).label("embedding_exists"),
+            _latest_job_column(Job.id, document_id, "extract").label("latest_extract_job_id"),
+            _latest_job_column(Job.id, document_id, "embed").label("latest_embed_job_id"),
+            _latest_job_column(Job.status, document_id, "embed").label("latest_embed_status"),
+            pipeline_job,
+        )
+        .select_from(anchor)
+        .outerjoin(pipeline_job, pipeline_job.id == pipeline_job_id)
+    )
+    row = (await db.execute(stmt)).one()
+    return PipelineSnapshot(
+        extraction_exists=row.extraction_exists,
+        embedding_exists=row.embedding_exists,
+        pipeline_job=row[5],
+        latest_extract_job_id=row.latest_extract_job_id,
+        latest_embed_job_id=row.latest_embed_job_id,
+        latest_embed_status=row.latest_embed_status,
+    )
 
 
 async def _set_step(
     db: AsyncSession,
     pipeline_job: Job,
+    steps: PipelineStepsMeta,
     step: str,
     status: str,
     job_id: UUID | None = None,
     error_message: str | None = None,
+    commit: bool = True,
 ) -> None:
-    metadata = _normalize_pipeline_metadata(pipeline_job.task_metadata)
-    step_data = metadata["steps"][step]
-    step_data["status"] = status
-    step_data["job_id"] = str(job_id) if job_id else step_data.get("job_id")
-    step_data["error_message"] = error_message
-    step_data["updated_at"] = _utc_now_iso()
-    pipeline_job.task_metadata = metadata
-    await db.commit()
-
-
-async def _ensure_step_job(db: AsyncSession, document_id: UUID, task_type: str) -> Job:
-    active = await _latest_job(db, document_id, task_type, statuses=ACTIVE_JOB_STATUSES)
-    if active:
-        return active
+    step_meta: StepMeta = getattr(steps, step)
+    step_meta.status = status
+    step_meta.job_id = str(job_id) if job_id else step_meta.job_id
+    step_meta.error_message = error_message
+    step_meta.updated_at = _utc_now_iso()
+    # Serialize into a fresh dict so the change is seen at flush; an unchanged value issues no UPDATE.
+    pipeline_job.task_metadata = {**(pipeline_job.task_metadata or {}), "steps": steps.model_dump()}
+    if commit:
+        await db.commit()
 
-    job = Job(document_id=document_id, task_type=task_type, status="queued")
-    db.add(job)
-    await db.commit()
-    await db.refresh(job)
+
+async def _upsert_active_job(
+    db: AsyncSession,
+    document_id: UUID,
+    task_type: str,
+    task_metadata: dict[str, Any] | None = None,
+    commit: bool = True,
+) -> Job:
+    # One round trip against uq_jobs_active_task: queue a new job, or touch and return the
+    # queued/processing one that already holds the slot.
+    stmt = (
+        pg_insert(Job)
+        .values(document_id=document_id, task_type=task_type, status="queued", task_metadata=task_metadata)
+        .on_conflict_do_update(
+            index_elements=[Job.document_id, Job.task_type],
+            # Literal predicate so Postgres can match the partial index at plan time.
+            index_where=text("status IN ('queued', 'processing')"),
+            set_={"updated_at": utc_timestamp()},
+        )
+        .returning(Job)
+        .execution_options(populate_existing=True)
+    )
+    job = (await db.scalars(stmt)).one()
+    if commit:
+        await db.commit()
     return job
 
 
@@ -109,24 +180,42 @@ async def _wait_for_job_terminal(
     db: AsyncSession,
     job_id: UUID,
     timeout_seconds: int = 1800,
-    poll_seconds: float = 0.5,
+    poll_seconds: float = JOB_WAIT_FALLBACK_POLL_SECONDS,
 ) -> Job:
-    started = time.monotonic()
-    while True:
-        job = await db.get(Job, job_id)
-        if not job:
-            raise RuntimeError(f"Dependent job was deleted: {job_id}")
-        await db.refresh(job)
-        if job.status not in ACTIVE_JOB_STATUSES:
-            return job
-        if time.monotonic() - started > timeout_seconds:
-            raise TimeoutError(f"Timed out waiting for job {job_id}")
-        await asyncio.sleep(poll_seconds)
+    from app.services.processing_jobs import JOB_TERMINAL_CHANNEL
+
+    deadline = time.monotonic() + timeout_seconds
+    # LISTEN before the first status read, so a job that finishes in between still wakes us.
+    # The periodic re-read only backs up a missed notification.
+    async with jobs_engine.connect() as listen_conn:
+        listen_conn = await listen_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await listen_conn.exec_driver_sql(f"LISTEN {JOB_TERMINAL_CHANNEL}")
+        driver_connection = (await listen_conn.get_raw_connection()).driver_connection
+        try:
+            while True:
+                job = await db.get(Job, job_id, populate_existing=True)
+                # End the read transaction so the session does not sit idle in transaction while waiting.
+                await db.commit()
+                if not job:
+                    raise RuntimeError(f"Dependent job was deleted: {job_id}")
+                if job.status not in ACTIVE_JOB_STATUSES:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Timed out waiting for job {job_id}")
+                # aclosing releases the connection lock that notifies() holds as soon as we stop reading.
+                async with aclosing(driver_connection.notifies(timeout=min(poll_seconds, remaining))) as notifies:
+                    async for notify in notifies:
+                        if notify.payload == str(job_id):
+                            break
+        finally:
+            await listen_conn.exec_driver_sql(f"UNLISTEN {JOB_TERMINAL_CHANNEL}")
 
 
 async def ensure_pipeline_job(document_id: UUID, db: AsyncSession, request_id: str | None = None) -> Job:
-    active = await _latest_job(db, document_id, PIPELINE_TASK_TYPE, statuses=ACTIVE_JOB_STATUSES)
-    if active:
+    snapshot = await _get_pipeline_snapshot(db, document_id)
+    active = snapshot.pipeline_job
+    if active and active.status in ACTIVE_JOB_STATUSES:
         logger.info(
             "pipeline_job_reused request_id=%s document_id=%s pipeline_job_id=%s status=%s",
             request_id,
@@ -136,11 +225,8 @@ async def ensure_pipeline_job(document_id: UUID, db: AsyncSession, request_id: s
         )
         return active
 
-    extraction_complete = await _has_extraction(db, document_id)
-    embedding_complete = await _is_embedding_complete(db, document_id)
-
-    if extraction_complete and embedding_complete:
-        existing_done = await _latest_job(db, document_id, PIPELINE_TASK_TYPE, statuses={"done"})
+    if snapshot.extraction_exists and snapshot.embedding_complete:
+        existing_done = snapshot.pipeline_job
         if existing_done:
             logger.info(
                 "pipeline_job_done_reused request_id=%s document_id=%s pipeline_job_id=%s",
@@ -150,14 +236,14 @@ async def ensure_pipeline_job(document_id: UUID, db: AsyncSession, request_id: s
             )
             return existing_done
 
-        latest_extract = await _latest_job(db, document_id, "extract")
-        latest_embed = await _latest_job(db, document_id, "embed")
+        latest_extract_id = snapshot.latest_extract_job_id
+        latest_embed_id = snapshot.latest_embed_job_id
         metadata = _normalize_pipeline_metadata({})
         metadata["steps"]["extract"]["status"] = "skipped"
-        metadata["steps"]["extract"]["job_id"] = str(latest_extract.id) if latest_extract else None
+        metadata["steps"]["extract"]["job_id"] = str(latest_extract_id) if latest_extract_id else None
         metadata["steps"]["extract"]["updated_at"] = _utc_now_iso()
         metadata["steps"]["embed"]["status"] = "skipped"
-        metadata["steps"]["embed"]["job_id"] = str(latest_embed.id) if latest_embed else None
+        metadata["steps"]["embed"]["job_id"] = str(latest_embed_id) if latest_embed_id else None
         metadata["steps"]["embed"]["updated_at"] = _utc_now_iso()
         metadata["started_at"] = _utc_now_iso()
         metadata["completed_at"] = _utc_now_iso()
@@ -179,15 +265,12 @@ async def ensure_pipeline_job(document_id: UUID, db: AsyncSession, request_id: s
         )
         return done_job
 
-    queued_job = Job(
-        document_id=document_id,
-        task_type=PIPELINE_TASK_TYPE,
-        status="queued",
+    queued_job = await _upsert_active_job(
+        db,
+        document_id,
+        PIPELINE_TASK_TYPE,
         task_metadata=_normalize_pipeline_metadata({}),
     )
-    db.add(queued_job)
-    await db.commit()
-    await db.refresh(queued_job)
     logger.info(
         "pipeline_job_queued request_id=%s document_id=%s pipeline_job_id=%s",
         request_id,
@@ -200,17 +283,25 @@ async def ensure_pipeline_job(document_id: UUID, db: AsyncSession, request_id: s
 async def run_pipeline_job(job_id: UUID, request_id: str | None = None) -> None:
     from app.services.processing_jobs import run_embedding_job, run_extraction_job
 
-    async with AsyncSessionLocal() as db:
-        pipeline_job = await db.get(Job, job_id)
-        if not pipeline_job or pipeline_job.task_type != PIPELINE_TASK_TYPE:
-            return
-
-        pipeline_job.status = "processing"
-        pipeline_job.error_message = None
-        metadata = _normalize_pipeline_metadata(pipeline_job.task_metadata)
-        metadata["started_at"] = metadata.get("started_at") or _utc_now_iso()
-        pipeline_job.task_metadata = metadata
+    async with JobSessionLocal() as db:
+        pipeline_job = (
+            await db.scalars(
+                update(Job)
+                .where(Job.id == job_id, Job.task_type == PIPELINE_TASK_TYPE)
+                .values(
+                    status="processing",
+                    error_message=None,
+                    task_metadata=_merged_metadata(
+                        started_at=func.coalesce(Job.task_metadata["started_at"].astext, _utc_now_iso())
+                    ),
+                )
+                .returning(Job)
+                .execution_options(populate_existing=True)
+            )
+        ).one_or_none()
         await db.commit()
+        if pipeline_job is None:
+            return
 
         logger.info(
             "pipeline_job_started request_id=%s document_id=%s pipeline_job_id=%s",
@@ -221,10 +312,12 @@ async def run_pipeline_job(job_id: UUID, request_id: str | None = None) -> None:
 
         try:
             document_id = pipeline_job.document_id
+            # Parsed once; _set_step mutates it and writes it back.
+            steps = PipelineMeta.model_validate(_object_or_empty(pipeline_job.task_metadata)).steps
+            snapshot = await _get_pipeline_snapshot(db, document_id)
 
-            if await _has_extraction(db, document_id):
-                latest_extract = await _latest_job(db, document_id, "extract")
-                await _set_step(db, pipeline_job, "extract", "skipped", latest_extract.id if latest_extract else None)
+            if snapshot.extraction_exists:
+                await _set_step(db, pipeline_job, steps, "extract", "skipped", snapshot.latest_extract_job_id)
                 logger.info(
                     "pipeline_extract_skipped request_id=%s document_id=%s pipeline_job_id=%s",
                     request_id,
@@ -232,8 +325,9 @@ async def run_pipeline_job(job_id: UUID, request_id: str | None = None) -> None:
                     pipeline_job.id,
                 )
             else:
-                extract_job = await _ensure_step_job(db, document_id, task_type="extract")
-                await _set_step(db, pipeline_job, "extract", "processing", extract_job.id)
+                # The step job and the pipeline's pointer to it land in one transaction.
+                extract_job = await _upsert_active_job(db, document_id, task_type="extract", commit=False)
+                await _set_step(db, pipeline_job, steps, "extract", "processing", extract_job.id)
                 logger.info(
                     "pipeline_extract_trigger request_id=%s document_id=%s pipeline_job_id=%s extract_job_id=%s",
                     request_id,
@@ -251,10 +345,12 @@ async def run_pipeline_job(job_id: UUID, request_id: str | None = None) -> None:
 
                 if not extract_job or extract_job.status not in EXTRACT_SUCCESS_STATUSES:
                     err = extract_job.error_message if extract_job else "Extraction step did not complete."
-                    await _set_step(db, pipeline_job, "extract", "failed", extract_job.id if extract_job else None, err)
+                    await _set_step(
+                        db, pipeline_job, steps, "extract", "failed", extract_job.id if extract_job else None, err
+                    )
                     raise RuntimeError(err or "Extraction step failed.")
 
-                await _set_step(db, pipeline_job, "extract", "done", extract_job.id)
+                await _set_step(db, pipeline_job, steps, "extract", "done", extract_job.id)
                 logger.info(
                     "pipeline_extract_done request_id=%s document_id=%s pipeline_job_id=%s extract_job_id=%s status=%s",
                     request_id,
@@ -263,10 +359,12 @@ async def run_pipeline_job(job_id: UUID, request_id: str | None = None) -> None:
                     extract_job.id,
                     extract_job.status,
                 )
+                # Embedding state may have moved while the extraction ran.
+                snapshot = await _get_pipeline_snapshot(db, document_id)
 
-            if await _is_embedding_complete(db, document_id):
-                latest_embed = await _latest_job(db, document_id, "embed")
-                await _set_step(db, pipeline_job, "embed", "skipped", latest_embed.id if latest_embed else None)
+            if snapshot.embedding_complete:
+                # Committed together with the pipeline's done status below.
+                await _set_step(db, pipeline_job, steps, "embed", "skipped", snapshot.latest_embed_job_id, commit=False)
                 logger.info(
                     "pipeline_embed_skipped request_id=%s document_id=%s pipeline_job_id=%s",
                     request_id,
@@ -274,8 +372,9 @@ async def run_pipeline_job(job_id: UUID, request_id: str | None = None) -> None:
                     pipeline_job.id,
                 )
             else:
-                embed_job = await _ensure_step_job(db, document_id, task_type="embed")
-                await _set_step(db, pipeline_job, "embed", "processing", embed_job.id)
+                # The step job and the pipeline's pointer to it land in one transaction.
+                embed_job = await _upsert_active_job(db, document_id, task_type="embed", commit=False)
+                await _set_step(db, pipeline_job, steps, "embed", "processing", embed_job.id)
                 logger.info(
                     "pipeline_embed_trigger request_id=%s document_id=%s pipeline_job_id=%s embed_job_id=%s",
                     request_id,
@@ -293,10 +392,12 @@ async def run_pipeline_job(job_id: UUID, request_id: str | None = None) -> None:
 
                 if not embed_job or embed_job.status not in EMBED_SUCCESS_STATUSES:
                     err = embed_job.error_message if embed_job else "Embedding step did not complete."
-                    await _set_step(db, pipeline_job, "embed", "failed", embed_job.id if embed_job else None, err)
+                    await _set_step(
+                        db, pipeline_job, steps, "embed", "failed", embed_job.id if embed_job else None, err
+                    )
                     raise RuntimeError(err or "Embedding step failed.")
 
-                await _set_step(db, pipeline_job, "embed", "done", embed_job.id)
+                await _set_step(db, pipeline_job, steps, "embed", "done", embed_job.id, commit=False)
                 logger.info(
                     "pipeline_embed_done request_id=%s document_id=%s pipeline_job_id=%s embed_job_id=%s status=%s",
                     request_id,
@@ -309,9 +410,7 @@ async def run_pipeline_job(job_id: UUID, request_id: str | None = None) -> None:
             pipeline_job = await db.get(Job, pipeline_job.id)
             if not pipeline_job:
                 return
-            metadata = _normalize_pipeline_metadata(pipeline_job.task_metadata)
-            metadata["completed_at"] = _utc_now_iso()
-            pipeline_job.task_metadata = metadata
+            pipeline_job.task_metadata = {**(pipeline_job.task_metadata or {}), "completed_at": _utc_now_iso()}
             pipeline_job.status = "done"
             pipeline_job.error_message = None
             await db.commit()
@@ -329,12 +428,13 @@ async def run_pipeline_job(job_id: UUID, request_id: str | None = None) -> None:
                 exc,
             )
             await db.rollback()
-            pipeline_job = await db.get(Job, job_id)
-            if not pipeline_job:
-                return
-            metadata = _normalize_pipeline_metadata(pipeline_job.task_metadata)
-            metadata["failed_at"] = _utc_now_iso()
-            pipeline_job.task_metadata = metadata
-            pipeline_job.status = "failed"
-            pipeline_job.error_message = str(exc)
+            await db.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(
+                    status="failed",
+                    error_message=str(exc),
+                    task_metadata=_merged_metadata(failed_at=_utc_now_iso()),
+                )
+            )
             await db.commit()
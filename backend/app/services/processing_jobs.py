@@ -1,90 +1,170 @@
+import asyncio
+import hashlib
 import time
 from uuid import UUID
 
-from sqlalchemy import delete, insert, select
+from pgvector.psycopg import register_vector_async
+from sqlalchemy import Text, cast, delete, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.logging import logger
-from app.db.database import AsyncSessionLocal
+from app.db.database import JobSessionLocal
 from app.db.models import DocumentPage, Embedding, Extraction, Job
 from app.services.chunker import chunk_text
 from app.services.embedder import generate_embeddings
 from app.services.extractor import extract_document_features
+from app.services.retrieval_cache import retrieval_cache
 from app.services.validator import validate_extraction
 
+# Binary COPY ships vectors as packed float4 instead of formatting every component as text.
+# id is left to the gen_random_uuid() column default.
+EMBEDDING_COPY_SQL = (
+    "COPY embeddings (document_id, chunk_id, page_start, page_end, pdf_page_start, pdf_page_end, content, "
+    "content_hash, embedding) FROM STDIN (FORMAT BINARY)"
+)
+# Postgres delivers NOTIFY only on commit, so a payload here means the job's final status is visible.
+JOB_TERMINAL_CHANNEL = "job_terminal"
+EMBEDDING_COPY_TYPES = ("uuid", "varchar", "int4", "int4", "int4", "int4", "text", "varchar", "vector")
+
+
+def _chunk_content_hash(content: str) -> str:
+    # The model is part of the key so switching embedding models re-embeds everything.
+    return hashlib.blake2b(f"{settings.openai_embed_model}\n{content}".encode(), digest_size=16).hexdigest()
+
+
+async def _claim_job(db: AsyncSession, job_id: UUID) -> UUID | None:
+    """Mark the job processing in one round trip; returns its document id, or None if it is gone."""
+    document_id = (
+        await db.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(status="processing", error_message=None)
+            .returning(Job.document_id)
+        )
+    ).scalar_one_or_none()
+    await db.commit()
+    return document_id
+
+
+async def _set_job_status(db: AsyncSession, job_id: UUID, status: str, error_message: str | None = None) -> None:
+    """Record a terminal status; waiters on JOB_TERMINAL_CHANNEL are notified when the transaction commits."""
+    await db.execute(update(Job).where(Job.id == job_id).values(status=status, error_message=error_message))
+    await db.execute(select(func.pg_notify(JOB_TERMINAL_CHANNEL, str(job_id))))
+
+
+async def _copy_embedding_rows(db: AsyncSession, rows: list[tuple]) -> None:
+    """Stream rows into embeddings on the session's connection, inside its open transaction."""
+    connection = await db.connection()
+    driver_connection = (await connection.get_raw_connection()).driver_connection
+    # Pooled connections keep their adapters, so the vector type lookup runs once per connection.
+    if driver_connection.adapters.types.get("vector") is None:
+        await register_vector_async(driver_connection)
+    async with driver_connection.cursor() as cursor:
+        async with cursor.copy(EMBEDDING_COPY_SQL) as copy:
+            copy.set_types(EMBEDDING_COPY_TYPES)
+            for row in rows:
+                await copy.write_row(row)
+
+
+async def _copy_embedding_batch(
+    db: AsyncSession,
+    document_id: UUID,
+    chunks: list[dict[str, object]],
+    start: int,
+    batch_embeddings: list[list[float]],
+) -> None:
+    rows_to_insert = []
+    for offset, embedding in enumerate(batch_embeddings):
+        chunk_meta = chunks[start + offset]
+        rows_to_insert.append(
+            (
+                document_id,
+                chunk_meta["chunk_id"],
+                chunk_meta["page_start"],
+                chunk_meta["page_end"],
+                chunk_meta["pdf_page_start"],
+                chunk_meta["pdf_page_end"],
+                chunk_meta["content"],
+                chunk_meta["content_hash"],
+                embedding,
+            )
+        )
+    await _copy_embedding_rows(db, rows_to_insert)
+
 
 async def run_extraction_job(job_id: UUID) -> None:
-    async with AsyncSessionLocal() as db:
-        job = await db.get(Job, job_id)
-        if not job:
+    async with JobSessionLocal() as db:
+        document_id = await _claim_job(db, job_id)
+        if document_id is None:
             return
 
-        job.status = "processing"
-        job.error_message = None
-        await db.commit()
-
         started_at = time.perf_counter()
         try:
-            result = await db.execute(
-                select(DocumentPage)
-                .where(DocumentPage.document_id == job.document_id)
-                .order_by(DocumentPage.page_number)
-            )
-            pages = result.scalars().all()
-            full_text = "\n\n".join([page.text or "" for page in pages])
+            # Postgres joins the page texts in page order, so one string comes back instead of a row per page.
+            page_count, full_text = (
+                await db.execute(
+                    select(
+                        func.count(),
+                        func.string_agg(
+                            DocumentPage.text,
+                            aggregate_order_by(literal("\n\n"), DocumentPage.page_number),
+                        ).filter(DocumentPage.text != ""),
+                    ).where(DocumentPage.document_id == document_id)
+                )
+            ).one()
+            if not page_count:
+                raise ValueError("No parsed pages found for document.")
+            full_text = full_text or ""
 
-            if not full_text.strip():
+            # Fail fast on empty or near-empty text instead of paying for an LLM round trip.
+            if len(full_text.strip()) < settings.extraction_min_chars:
                 raise ValueError("No extracted text found for document.")
 
             extraction_pydantic = await extract_document_features(full_text)
             status = validate_extraction(extraction_pydantic)
 
-            extraction_entry = Extraction(
-                document_id=job.document_id,
-                data=extraction_pydantic.model_dump(),
-                status=status,
+            # Core INSERT: nothing reads the row back, so skip ORM state and the RETURNING of defaults.
+            # The model serializes itself straight to JSON text; Postgres parses it into JSONB, so no
+            # intermediate dict is built and re-encoded on the way to the driver.
+            await db.execute(
+                insert(Extraction).values(
+                    document_id=document_id,
+                    data=cast(literal(extraction_pydantic.model_dump_json(), Text), JSONB),
+                    status=status,
+                )
             )
-            db.add(extraction_entry)
-
-            job.status = "done"
-            if status == "FLAGGED":
-                job.status = "needs_review"
 
+            job_status = "needs_review" if status == "FLAGGED" else "done"
+            await _set_job_status(db, job_id, job_status)
             await db.commit()
             logger.info(
                 "extract_job_done job_id=%s document_id=%s status=%s duration_ms=%.2f",
                 job_id,
-                job.document_id,
-                job.status,
+                document_id,
+                job_status,
                 (time.perf_counter() - started_at) * 1000,
             )
         except Exception as exc:
-            logger.error("extract_job_failed job_id=%s document_id=%s error=%s", job_id, job.document_id, exc)
+            logger.error("extract_job_failed job_id=%s document_id=%s error=%s", job_id, document_id, exc)
             await db.rollback()
-            job = await db.get(Job, job_id)
-            if not job:
-                return
-            job.status = "failed"
-            job.error_message = f"Extraction job failed: {exc}"
+            await _set_job_status(db, job_id, "failed", error_message=f"Extraction job failed: {exc}")
             await db.commit()
 
 
 async def run_embedding_job(job_id: UUID) -> None:
-    async with AsyncSessionLocal() as db:
-        job = await db.get(Job, job_id)
-        if not job:
+    async with JobSessionLocal() as db:
+        document_id = await _claim_job(db, job_id)
+        if document_id is None:
             return
 
-        job.status = "processing"
-        job.error_message = None
-        await db.commit()
-
         started_at = time.perf_counter()
         try:
-            logger.info("embed_job_started job_id=%s document_id=%s", job_id, job.document_id)
+            logger.info("embed_job_started job_id=%s document_id=%s", job_id, document_id)
             result = await db.execute(
                 select(DocumentPage)
-                .where(DocumentPage.document_id == job.document_id)
+                .where(DocumentPage.document_id == document_id)
                 .order_by(DocumentPage.page_number)
             )
             pages = result.scalars().all()
@@ -106,6 +186,7 @@ async def run_embedding_job(job_id: UUID) -> None:
                             "pdf_page_start": page.page_number,
                             "pdf_page_end": page.page_number,
                             "content": chunk.content,
+                            "content_hash": _chunk_content_hash(chunk.content),
                             "token_count": chunk.approx_tokens,
                         }
                     )
@@ -113,7 +194,7 @@ async def run_embedding_job(job_id: UUID) -> None:
             logger.info(
                 "chunking_complete job_id=%s document_id=%s pages=%s chunks=%s chunk_size_tokens=%s overlap_tokens=%s",
                 job_id,
-                job.document_id,
+                document_id,
                 len(pages),
                 len(all_chunks),
                 settings.chunk_size_tokens,
@@ -121,58 +202,81 @@ async def run_embedding_job(job_id: UUID) -> None:
             )
 
             if not all_chunks:
-                job.status = "done"
+                await _set_job_status(db, job_id, "done")
                 await db.commit()
                 return
 
-            await db.execute(delete(Embedding).where(Embedding.document_id == job.document_id))
-            texts = [str(chunk["content"]) for chunk in all_chunks]
+            # Keep rows whose chunk text is unchanged; drop stale or changed ones and embed only those.
+            existing_hashes = dict(
+                (
+                    await db.execute(
+                        select(Embedding.chunk_id, Embedding.content_hash).where(Embedding.document_id == document_id)
+                    )
+                ).all()
+            )
+            new_hashes = {chunk["chunk_id"]: chunk["content_hash"] for chunk in all_chunks}
+            outdated_chunk_ids = [
+                chunk_id for chunk_id, content_hash in existing_hashes.items() if new_hashes.get(chunk_id) != content_hash
+            ]
+            if outdated_chunk_ids:
+                await db.execute(
+                    delete(Embedding).where(
+                        Embedding.document_id == document_id,
+                        Embedding.chunk_id.in_(outdated_chunk_ids),
+                    )
+                )
+            pending_chunks = [
+                chunk for chunk in all_chunks if existing_hashes.get(chunk["chunk_id"]) != chunk["content_hash"]
+            ]
+            logger.info(
+                "embedding_delta job_id=%s document_id=%s reused=%s removed=%s pending=%s",
+                job_id,
+                document_id,
+                len(all_chunks) - len(pending_chunks),
+                len(outdated_chunk_ids),
+                len(pending_chunks),
+            )
+            texts = [str(chunk["content"]) for chunk in pending_chunks]
             batch_size = settings.embedding_batch_size
 
-            for start in range(0, len(texts), batch_size):
-                batch_texts = texts[start : start + batch_size]
-                batch_embeddings = await generate_embeddings(batch_texts, request_id=str(job_id))
+            # Batches are embedded concurrently but copied one at a time, since the session's
+            # connection can only run one COPY. chunk_id carries the order, so completion order is fine.
+            semaphore = asyncio.Semaphore(settings.embedding_concurrency)
 
-                rows_to_insert = []
-                for offset, embedding in enumerate(batch_embeddings):
-                    chunk_meta = all_chunks[start + offset]
-                    rows_to_insert.append(
-                        {
-                            "document_id": job.document_id,
-                            "chunk_id": chunk_meta["chunk_id"],
-                            "page_start": chunk_meta["page_start"],
-                            "page_end": chunk_meta["page_end"],
-                            "pdf_page_start": chunk_meta["pdf_page_start"],
-                            "pdf_page_end": chunk_meta["pdf_page_end"],
-                            "content": chunk_meta["content"],
-                            "embedding": embedding,
-                        }
-                    )
+            async def _embed_batch(batch_start: int) -> tuple[int, list[list[float]]]:
+                async with semaphore:
+                    batch_texts = texts[batch_start : batch_start + batch_size]
+                    return batch_start, await generate_embeddings(batch_texts, request_id=str(job_id))
 
-                await db.execute(insert(Embedding), rows_to_insert)
-                logger.info(
-                    "embedding_batch_inserted job_id=%s batch_start=%s batch_size=%s embedding_model=%s",
-                    job_id,
-                    start,
-                    len(rows_to_insert),
-                    settings.openai_embed_model,
-                )
+            tasks = [asyncio.create_task(_embed_batch(start)) for start in range(0, len(texts), batch_size)]
+            try:
+                for next_batch in asyncio.as_completed(tasks):
+                    start, batch_embeddings = await next_batch
+                    await _copy_embedding_batch(db, document_id, pending_chunks, start, batch_embeddings)
+                    logger.info(
+                        "embedding_batch_inserted job_id=%s batch_start=%s batch_size=%s embedding_model=%s",
+                        job_id,
+                        start,
+                        len(batch_embeddings),
+                        settings.openai_embed_model,
+                    )
+            finally:
+                for task in tasks:
+                    task.cancel()
 
-            job.status = "done"
+            # Same transaction as the COPYs, so the rows and the done status land together.
+            await _set_job_status(db, job_id, "done")
             await db.commit()
+            retrieval_cache.invalidate()
             logger.info(
                 "embed_job_done job_id=%s document_id=%s chunks=%s duration_ms=%.2f",
                 job_id,
-                job.document_id,
+                document_id,
                 len(all_chunks),
                 (time.perf_counter() - started_at) * 1000,
             )
         except Exception as exc:
             logger.exception("embed_job_failed job_id=%s error=%s", job_id, exc)
             await db.rollback()
-            job = await db.get(Job, job_id)
-            if not job:
-                return
-            job.status = "failed"
-            job.error_message = f"Embedding job failed: {exc}"
+            await _set_job_status(db, job_id, "failed", error_message=f"Embedding job failed: {exc}")
             await db.commit()
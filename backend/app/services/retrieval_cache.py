@@ -0,0 +1,72 @@
+import math
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Sequence
+from typing import Any
+
+from app.core.config import settings
+
+NS_PER_SECOND = 1_000_000_000
+
+
+class ApproxEmbeddingCache:
+    """
+    In-process LRU of retrieval results keyed by question embedding. A lookup hits when a question
+    stored under the same scope lies within `max_distance` cosine distance; question embeddings are
+    unit length, so that distance is 1 - dot product.
+    """
+
+    def __init__(self, capacity: int, max_distance: float, ttl_seconds: float):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self._ttl_ns = int(ttl_seconds * NS_PER_SECOND)
+        # entry id -> (scope, question embedding, expires_at, value)
+        self._entries: OrderedDict[int, tuple[Hashable, Sequence[float], int, Any]] = OrderedDict()
+        self._next_id = 0
+        self.generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 and self._ttl_ns > 0
+
+    def lookup(self, scope: Hashable, embedding: Sequence[float]) -> Any | None:
+        if not self.enabled:
+            return None
+        now = time.monotonic_ns()
+        best_id = None
+        best_distance = self.max_distance
+        for entry_id, (entry_scope, key, expires_at, _) in self._entries.items():
+            if entry_scope != scope or expires_at <= now:
+                continue
+            distance = 1.0 - math.sumprod(key, embedding)
+            if distance <= best_distance:
+                best_id, best_distance = entry_id, distance
+        if best_id is None:
+            return None
+        self._entries.move_to_end(best_id)
+        return self._entries[best_id][3]
+
+    def put(self, scope: Hashable, embedding: Sequence[float], value: Any, generation: int) -> None:
+        # A result computed before the last invalidation may predate the change; drop it.
+        if not self.enabled or generation != self.generation:
+            return
+        now = time.monotonic_ns()
+        if len(self._entries) >= self.capacity:
+            for entry_id in [entry_id for entry_id, entry in self._entries.items() if entry[2] <= now]:
+                del self._entries[entry_id]
+        while len(self._entries) >= self.capacity:
+            self._entries.popitem(last=False)
+        self._entries[self._next_id] = (scope, embedding, now + self._ttl_ns, value)
+        self._next_id += 1
+
+    def invalidate(self) -> None:
+        """Forget every stored result; call whenever the searchable chunk set changes."""
+        self.generation += 1
+        self._entries.clear()
+
+
+retrieval_cache = ApproxEmbeddingCache(
+    capacity=settings.retrieval_cache_size,
+    max_distance=settings.retrieval_cache_max_distance,
+    ttl_seconds=settings.retrieval_cache_ttl_s,
+)
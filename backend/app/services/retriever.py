@@ -1,16 +1,18 @@
 from dataclasses import dataclass
+import logging
 import re
 from uuid import UUID
 
-from sqlalchemy import func, select, text
+from sqlalchemy import func, literal, select, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.logging import get_request_id, logger
 from app.db.models import Document, Embedding
 from app.services.embedder import generate_embeddings
+from app.services.retrieval_cache import retrieval_cache
 
-STOPWORDS = {
+STOPWORDS = frozenset({
     "a",
     "an",
     "and",
@@ -27,7 +29,7 @@ STOPWORDS = {
     "to",
     "what",
     "which",
-}
+})
 DIRECTIVE_ANCHORS = (
     "solution gas",
     "conservation",
@@ -45,14 +47,44 @@ DIRECTIVE_ANCHORS = (
     "incineration",
     "enclosed combustion",
 )
+# Everything str.isalnum() rejects except whitespace, "-" and "$"; one C pass instead of a per-char loop.
+TOKEN_STRIP_RE = re.compile(r"[^\w\s$-]|_")
+# Identifiers such as "3.2" or "1,042" as written; keyword tokens drop their punctuation and short ones.
+NUMBER_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)*")
 NUMERIC_UNIT_RE = re.compile(
     r"(\d[\d,.\-]*)\s*(m3/day|m3/d|m3/m3|m3|hours?|hour|days?|day|%|dollars?|mol/kmol)"
 )
 
 
+@dataclass(frozen=True, slots=True)
+class EmbeddingRow:
+    """The embedding columns retrieval and answering read; the vector itself never leaves Postgres."""
+
+    id: UUID
+    document_id: UUID
+    chunk_id: str
+    page_start: int
+    page_end: int
+    pdf_page_start: int
+    pdf_page_end: int
+    content: str
+
+
+EMBEDDING_ROW_COLUMNS = (
+    Embedding.id,
+    Embedding.document_id,
+    Embedding.chunk_id,
+    Embedding.page_start,
+    Embedding.page_end,
+    Embedding.pdf_page_start,
+    Embedding.pdf_page_end,
+    Embedding.content,
+)
+
+
 @dataclass
 class RetrievedChunk:
-    embedding: Embedding
+    embedding: EmbeddingRow
     filename: str
     distance: float | None
     vector_similarity: float | None
@@ -61,14 +93,6 @@ class RetrievedChunk:
     rank: int
 
 
-@dataclass
-class _MergedCandidate:
-    embedding: Embedding
-    filename: str
-    best_distance: float | None
-    query_hits: int
-
-
 def _clip(value: float, min_value: float = 0.0, max_value: float = 1.0) -> float:
     return max(min_value, min(max_value, value))
 
@@ -84,17 +108,20 @@ def _normalize_match_text(text: str) -> str:
 
 
 def _keyword_tokens(text: str) -> list[str]:
-    normalized = _normalize_match_text(text).replace("/", " ")
-    raw_tokens = normalized.split()
-    clean_tokens = []
-    for token in raw_tokens:
-        token = "".join(ch for ch in token if ch.isalnum() or ch in "-$")
-        if len(token) < 3 or token in STOPWORDS:
-            continue
-        clean_tokens.append(token)
+    normalized = TOKEN_STRIP_RE.sub("", _normalize_match_text(text).replace("/", " "))
+    clean_tokens = [token for token in normalized.split() if len(token) >= 3 and token not in STOPWORDS]
     return list(dict.fromkeys(clean_tokens))
 
 
+def _question_cache_terms(question: str) -> frozenset[str]:
+    """
+    The question words lexical ranking reads: keyword tokens (overlap, full-text pool, expansions)
+    plus every number. Questions that embed alike but differ in any of these rank differently.
+    """
+    numbers = NUMBER_TOKEN_RE.findall(_normalize_match_text(question))
+    return frozenset(_keyword_tokens(question)).union(numbers)
+
+
 def _question_suggests_flaring_economics(question: str) -> bool:
     lower = _normalize_match_text(question)
     return any(
@@ -256,12 +283,12 @@ def _dedupe_by_pdf_page(chunks: list[RetrievedChunk]) -> list[RetrievedChunk]:
 def _select_diverse_top_chunks(question: str, ranked_chunks: list[RetrievedChunk], top_k: int) -> list[RetrievedChunk]:
     deduped_ranked = _dedupe_by_pdf_page(ranked_chunks)
     selected: list[RetrievedChunk] = []
-    selected_ids: set[str] = set()
+    selected_ids: set[UUID] = set()
 
     def _add(chunk: RetrievedChunk | None) -> None:
         if chunk is None:
             return
-        chunk_id = str(chunk.embedding.id)
+        chunk_id = chunk.embedding.id
         if chunk_id in selected_ids:
             return
         selected_ids.add(chunk_id)
@@ -295,23 +322,55 @@ async def retrieve_chunks(
     safe_top_k = max(1, min(top_k, settings.rag_max_top_k))
     safe_vector_candidates = max(safe_top_k, min(vector_candidates, 200))
     safe_lexical_weight = _clip(lexical_weight)
+    # Near-identical questions over the same documents with the same keywords and numbers retrieve
+    # the same chunks; the answer is still generated for the question actually asked.
+    cache_scope = (
+        frozenset(document_ids) if document_ids else None,
+        _question_cache_terms(question),
+        safe_top_k,
+        safe_vector_candidates,
+        safe_lexical_weight,
+    )
+    cache_generation = retrieval_cache.generation
+    cached_chunks = retrieval_cache.lookup(cache_scope, question_embedding)
+    if cached_chunks is not None:
+        logger.info("retrieval_cache_hit request_id=%s retrieved=%s", req_id, len(cached_chunks))
+        return list(cached_chunks)
+
     query_variants = _build_query_expansions(question)
     per_query_candidates = max(
         safe_top_k * 2,
         min(40, int((safe_vector_candidates * 1.2) / max(1, len(query_variants))) + safe_top_k),
     )
 
-    logger.info(
-        "retrieval_start request_id=%s top_k=%s vector_candidates=%s lexical_weight=%.2f query_variants=%s filters_document_ids=%s",
-        req_id,
-        safe_top_k,
-        safe_vector_candidates,
-        safe_lexical_weight,
-        query_variants,
-        [str(doc_id) for doc_id in document_ids] if document_ids else [],
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "retrieval_start request_id=%s top_k=%s vector_candidates=%s lexical_weight=%.2f query_variants=%s filters_document_ids=%s",
+            req_id,
+            safe_top_k,
+            safe_vector_candidates,
+            safe_lexical_weight,
+            query_variants,
+            [str(doc_id) for doc_id in document_ids] if document_ids else [],
+        )
 
-    await db.execute(text(f"SET LOCAL ivfflat.probes = {settings.vector_ivfflat_probes}"))
+    # Transaction-local, like SET LOCAL. hnsw returns at most ef_search rows per scan, so it must
+    # cover the per-variant LIMIT; probes only matters if the ivfflat fallback index is in use.
+    # The document_ids filter is applied to what the index scan returns, so scoped searches widen
+    # the scan to still fill their LIMIT with rows from the requested documents.
+    ef_search = max(settings.vector_hnsw_ef_search, per_query_candidates)
+    probes = settings.vector_ivfflat_probes
+    if document_ids:
+        ef_search *= settings.vector_filtered_search_factor
+        probes *= settings.vector_filtered_search_factor
+    search_settings = [
+        func.set_config("hnsw.ef_search", str(min(ef_search, 1000)), True),
+        func.set_config("ivfflat.probes", str(probes), True),
+    ]
+    if document_ids and settings.vector_hnsw_iterative_scan:
+        # strict_order keeps each scan in exact distance order, which the per-variant LIMIT relies on.
+        search_settings.append(func.set_config("hnsw.iterative_scan", "strict_order", True))
+    await db.execute(select(*search_settings))
 
     query_embeddings: list[list[float]] = [question_embedding]
     if len(query_variants) > 1:
@@ -322,80 +381,83 @@ async def retrieve_chunks(
             query_variants = query_variants[:1]
             query_embeddings = [question_embedding]
 
-    merged_candidates: dict[str, _MergedCandidate] = {}
-    for query_idx, embedding_vector in enumerate(query_embeddings):
-        distance = Embedding.embedding.cosine_distance(embedding_vector).label("distance")
-        vector_stmt = (
-            select(Embedding, Document.filename, distance)
-            .join(Document, Document.id == Embedding.document_id)
+    # One round trip: an ANN top-N per query variant plus a full-text top-N matching any of the
+    # question's keywords, so chunks that share its wording but sit outside every ANN pool still get
+    # ranked. Hits are merged per chunk (best distance, ANN hit count); the lexical score is still
+    # ts_rank_cd of the whole question over the stored content_tsv. Plain columns rather than the
+    # Embedding entity: no ORM identity-map bookkeeping for up to 200 rows.
+    question_tsquery = func.websearch_to_tsquery("english", question)
+    hit_stmts = []
+    for embedding_vector in query_embeddings:
+        distance = Embedding.embedding.cosine_distance(embedding_vector)
+        hit_stmts.append(
+            select(Embedding.id.label("embedding_id"), distance.label("distance"), literal(1).label("vector_hit"))
+            .order_by(distance.asc())
+            .limit(per_query_candidates)
         )
-        if document_ids:
-            vector_stmt = vector_stmt.where(Embedding.document_id.in_(document_ids))
-        vector_stmt = vector_stmt.order_by(distance.asc()).limit(per_query_candidates)
-        vector_rows = (await db.execute(vector_stmt)).all()
-
-        for embedding_row, filename, dist in vector_rows:
-            candidate_id = str(embedding_row.id)
-            distance_value = float(dist) if dist is not None else None
-            existing = merged_candidates.get(candidate_id)
-            if not existing:
-                merged_candidates[candidate_id] = _MergedCandidate(
-                    embedding=embedding_row,
-                    filename=filename,
-                    best_distance=distance_value,
-                    query_hits=1,
-                )
-                continue
-
-            existing.query_hits += 1
-            if existing.best_distance is None:
-                existing.best_distance = distance_value
-            elif distance_value is not None and distance_value < existing.best_distance:
-                existing.best_distance = distance_value
-
-        logger.debug(
-            "retrieval_query_variant_scanned request_id=%s query_index=%s rows=%s",
-            req_id,
-            query_idx,
-            len(vector_rows),
+    # A leading "-" negates a term in websearch syntax.
+    question_keywords = [token.lstrip("-") for token in _keyword_tokens(question) if token.lstrip("-")]
+    if question_keywords:
+        keyword_tsquery = func.websearch_to_tsquery("english", " or ".join(question_keywords))
+        hit_stmts.append(
+            select(
+                Embedding.id.label("embedding_id"),
+                Embedding.embedding.cosine_distance(question_embedding).label("distance"),
+                literal(0).label("vector_hit"),
+            )
+            .where(Embedding.content_tsv.op("@@")(keyword_tsquery))
+            .order_by(func.ts_rank_cd(Embedding.content_tsv, keyword_tsquery).desc())
+            .limit(per_query_candidates)
         )
+    if document_ids:
+        hit_stmts = [hit_stmt.where(Embedding.document_id.in_(document_ids)) for hit_stmt in hit_stmts]
+    hit_subqueries = [hit_stmt.subquery() for hit_stmt in hit_stmts]
+    hits = union_all(
+        *(select(hit.c.embedding_id, hit.c.distance, hit.c.vector_hit) for hit in hit_subqueries)
+    ).subquery("hits")
+    candidates = (
+        select(
+            hits.c.embedding_id,
+            func.min(hits.c.distance).label("best_distance"),
+            func.sum(hits.c.vector_hit).label("query_hits"),
+        )
+        .group_by(hits.c.embedding_id)
+        .subquery("candidates")
+    )
+    candidate_stmt = (
+        select(
+            *EMBEDDING_ROW_COLUMNS,
+            Document.filename,
+            candidates.c.best_distance,
+            candidates.c.query_hits,
+            func.ts_rank_cd(Embedding.content_tsv, question_tsquery).label("lexical_score"),
+        )
+        .join(candidates, candidates.c.embedding_id == Embedding.id)
+        .join(Document, Document.id == Embedding.document_id)
+    )
+    candidate_rows = (await db.execute(candidate_stmt)).all()
 
-    if not merged_candidates:
+    if not candidate_rows:
         logger.info("retrieval_no_candidates request_id=%s", req_id)
         return []
 
-    lexical_scores: dict[str, float] = {}
-    candidate_ids = [candidate.embedding.id for candidate in merged_candidates.values()]
     keyword_tokens = _keyword_tokens(" ".join(query_variants))
-    try:
-        lexical_stmt = (
-            select(
-                Embedding.id,
-                func.ts_rank_cd(
-                    func.to_tsvector("english", Embedding.content),
-                    func.websearch_to_tsquery("english", question),
-                ).label("lexical_score"),
-            )
-            .where(Embedding.id.in_(candidate_ids))
-        )
-        lexical_rows = (await db.execute(lexical_stmt)).all()
-        lexical_scores = {str(row[0]): float(row[1] or 0.0) for row in lexical_rows}
-    except Exception as exc:
-        logger.warning("retrieval_lexical_rerank_failed request_id=%s error=%s", req_id, exc)
-
     retrieved: list[RetrievedChunk] = []
-    for candidate in merged_candidates.values():
-        embedding_row = candidate.embedding
+    column_count = len(EMBEDDING_ROW_COLUMNS)
+    for row in candidate_rows:
+        embedding_row = EmbeddingRow(*row[:column_count])
+        filename, best_distance, query_hits, ts_rank = row[column_count:]
         content_lower = _normalize_match_text(embedding_row.content)
         token_hits = 0
         if keyword_tokens:
             token_hits = sum(1 for token in keyword_tokens if token in content_lower)
         overlap_score = (token_hits / len(keyword_tokens)) if keyword_tokens else 0.0
 
-        vector_similarity = None if candidate.best_distance is None else _clip(1.0 - candidate.best_distance)
-        ts_rank_score = _clip(lexical_scores.get(str(embedding_row.id), 0.0))
+        distance_value = float(best_distance) if best_distance is not None else None
+        vector_similarity = None if distance_value is None else _clip(1.0 - distance_value)
+        ts_rank_score = _clip(float(ts_rank or 0.0))
         keyword_boost = _keyword_boost_score(embedding_row.content, question)
-        query_hit_bonus = min(0.2, max(0.0, 0.05 * (candidate.query_hits - 1)))
+        query_hit_bonus = min(0.2, max(0.0, 0.05 * (query_hits - 1)))
         lexical_score = _clip((0.45 * ts_rank_score) + (0.30 * overlap_score) + (0.25 * keyword_boost))
         vec_score = vector_similarity if vector_similarity is not None else 0.0
         combined_score = _clip(
@@ -406,14 +468,20 @@ async def retrieve_chunks(
         retrieved.append(
             RetrievedChunk(
                 embedding=embedding_row,
-                filename=candidate.filename,
-                distance=candidate.best_distance,
+                filename=filename,
+                distance=distance_value,
                 vector_similarity=vector_similarity,
                 lexical_score=lexical_score,
                 combined_score=combined_score,
                 rank=0,
             )
         )
+    logger.debug(
+        "retrieval_candidates_scanned request_id=%s query_variants=%s rows=%s",
+        req_id,
+        len(query_embeddings),
+        len(candidate_rows),
+    )
 
     retrieved.sort(key=lambda chunk: (-chunk.combined_score, chunk.distance if chunk.distance is not None else 10.0))
     final_chunks = _select_diverse_top_chunks(question, retrieved, safe_top_k)
@@ -421,22 +489,25 @@ async def retrieve_chunks(
     for idx, chunk in enumerate(final_chunks, start=1):
         chunk.rank = idx
 
-    logger.info(
-        "retrieval_complete request_id=%s retrieved=%s top_chunks=%s",
-        req_id,
-        len(final_chunks),
-        [
-            {
-                "chunk_id": chunk.embedding.chunk_id,
-                "document_id": str(chunk.embedding.document_id),
-                "distance": round(chunk.distance or 0.0, 6),
-                "vector_similarity": round(chunk.vector_similarity or 0.0, 6),
-                "lexical_score": round(chunk.lexical_score, 6),
-                "combined_score": round(chunk.combined_score, 6),
-                "pdf_page_start": chunk.embedding.pdf_page_start,
-                "pdf_page_end": chunk.embedding.pdf_page_end,
-            }
-            for chunk in final_chunks
-        ],
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "retrieval_complete request_id=%s retrieved=%s top_chunks=%s",
+            req_id,
+            len(final_chunks),
+            [
+                {
+                    "chunk_id": chunk.embedding.chunk_id,
+                    "document_id": str(chunk.embedding.document_id),
+                    "distance": round(chunk.distance or 0.0, 6),
+                    "vector_similarity": round(chunk.vector_similarity or 0.0, 6),
+                    "lexical_score": round(chunk.lexical_score, 6),
+                    "combined_score": round(chunk.combined_score, 6),
+                    "pdf_page_start": chunk.embedding.pdf_page_start,
+                    "pdf_page_end": chunk.embedding.pdf_page_end,
+                }
+                for chunk in final_chunks
+            ],
+        )
+    if final_chunks:
+        retrieval_cache.put(cache_scope, question_embedding, tuple(final_chunks), cache_generation)
     return final_chunks
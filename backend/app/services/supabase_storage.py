@@ -1,33 +1,46 @@
-from typing import Optional
-
-from supabase import create_client, Client
+from typing import TYPE_CHECKING, BinaryIO, Optional
 
 from app.core.config import settings
 from app.core.logging import logger
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 class SupabaseStorage:
     def __init__(self):
-        self.supabase: Optional[Client] = None
+        self.supabase: Optional["Client"] = None
         self.bucket = settings.supabase_storage_bucket
 
-    def _get_client(self) -> Client:
+    def _get_client(self) -> "Client":
         if self.supabase is not None:
             return self.supabase
         if not settings.supabase_url or not settings.supabase_service_role_key:
             raise RuntimeError("Supabase credentials are not configured.")
+        from supabase import create_client
+
         self.supabase = create_client(
             settings.supabase_url,
             settings.supabase_service_role_key,
         )
         return self.supabase
 
-    def upload_file(self, file_bytes: bytes, destination_key: str, content_type: str = "application/pdf") -> str:
-        """Upload a file to Supabase Storage."""
+    def upload_file(
+        self,
+        file: bytes | BinaryIO,
+        destination_key: str,
+        content_type: str = "application/pdf",
+    ) -> str:
+        """Upload bytes or an on-disk file object to Supabase Storage."""
         logger.info("Uploading file to %s/%s", self.bucket, destination_key)
+        if not isinstance(file, bytes):
+            # storage3 streams a BufferedReader body and closes it afterwards; closefd=False
+            # leaves the caller's file open.
+            file.seek(0)
+            file = open(file.fileno(), "rb", closefd=False)
         try:
             self._get_client().storage.from_(self.bucket).upload(
                 path=destination_key,
-                file=file_bytes,
+                file=file,
                 file_options={"content-type": content_type, "upsert": 'true'},
             )
             return destination_key
@@ -1,6 +1,9 @@
+import re
 from datetime import datetime
 from app.schemas.extraction import ExtractionSchema
 
+CURRENCY_CODE_RE = re.compile(r"[A-Z]{3}")
+
 def validate_extraction(data: ExtractionSchema) -> str:
     """
     Returns PASSED, FLAGGED, or FAILED based on deterministic rules.
@@ -21,7 +24,7 @@ def validate_extraction(data: ExtractionSchema) -> str:
     if data.total_amount < 0:
         return "FAILED"
         
-    if len(data.currency) != 3 or not data.currency.isalpha() or not data.currency.isupper():
+    if not CURRENCY_CODE_RE.fullmatch(data.currency):
         return "FAILED"
         
     if data.confidence < 0.6:
@@ -1,13 +1,15 @@
 import unittest
+from datetime import datetime, timezone
 from types import SimpleNamespace
 from uuid import uuid4
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 from fastapi.testclient import TestClient
 
+from app.core.ttl_cache import TTLCache
 from app.db.database import get_db
 from app.main import app
-from app.schemas.qa import AskResponse, Citation
+from app.schemas.qa import MAX_ASK_DOC_IDS, AskResponse, Citation
 from app.services.retriever import RetrievedChunk
 
 
@@ -15,6 +17,33 @@ async def _fake_db_dependency():
     yield SimpleNamespace()
 
 
+class _ExpiringDocument:
+    """Stands in for the inserted Document row: reading it after rollback fails, as under AsyncSession."""
+
+    def __init__(self, document_id) -> None:
+        self._id = document_id
+        self.expired = False
+
+    @property
+    def id(self):
+        if self.expired:
+            raise AssertionError("expired Document accessed after rollback")
+        return self._id
+
+
+class _UploadRollbackSession:
+    def __init__(self) -> None:
+        self.doc: _ExpiringDocument | None = None
+        self.rollback = AsyncMock(side_effect=self._expire)
+
+    async def scalars(self, stmt):
+        self.doc = _ExpiringDocument(stmt.compile().params["id"])
+        return SimpleNamespace(first=lambda: self.doc)
+
+    async def _expire(self) -> None:
+        self.doc.expired = True
+
+
 class ApiContractTests(unittest.TestCase):
     def setUp(self) -> None:
         app.dependency_overrides[get_db] = _fake_db_dependency
@@ -28,6 +57,18 @@ class ApiContractTests(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(resp.json(), {"status": "ok"})
 
+    def test_upload_preflight_allows_content_sha256_header(self) -> None:
+        resp = self.client.options(
+            "/documents",
+            headers={
+                "Origin": "http://localhost:3000",
+                "Access-Control-Request-Method": "POST",
+                "Access-Control-Request-Headers": "content-type,x-content-sha256",
+            },
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("x-content-sha256", resp.headers["access-control-allow-headers"].lower())
+
     def test_documents_reject_non_pdf(self) -> None:
         resp = self.client.post(
             "/documents",
@@ -36,10 +77,71 @@ class ApiContractTests(unittest.TestCase):
         self.assertEqual(resp.status_code, 400)
         self.assertIn("Only PDF files are supported", resp.text)
 
+    def test_documents_parse_rejection_returns_400_after_rollback(self) -> None:
+        session = _UploadRollbackSession()
+
+        async def _db():
+            yield session
+
+        app.dependency_overrides[get_db] = _db
+        with (
+            patch("app.routers.documents.parse_pdf", AsyncMock(side_effect=ValueError("PDF has too many pages."))),
+            patch("app.routers.documents.storage_service.upload_file"),
+            patch("app.routers.documents.storage_service.delete_files") as delete_files,
+        ):
+            resp = self.client.post(
+                "/documents",
+                files={"file": ("sample.pdf", b"%PDF-1.4", "application/pdf")},
+            )
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("PDF has too many pages.", resp.text)
+        session.rollback.assert_awaited_once()
+        delete_files.assert_called_once()
+
+    def test_documents_reject_oversized_upload(self) -> None:
+        with patch("app.routers.documents.settings.max_upload_mb", 0):
+            resp = self.client.post(
+                "/documents",
+                files={"file": ("big.pdf", b"%PDF-1.4 payload", "application/pdf")},
+            )
+        self.assertEqual(resp.status_code, 413)
+        self.assertIn("File too large", resp.text)
+
+    def test_documents_reject_oversized_content_length_before_reading_body(self) -> None:
+        async def _ingest(**kwargs):
+            raise AssertionError("oversized upload reached the router")
+
+        with (
+            patch("app.main.settings.max_upload_mb", 0),
+            patch("app.routers.documents._ingest_pdf_upload", side_effect=_ingest),
+        ):
+            resp = self.client.post(
+                "/documents",
+                files={"file": ("big.pdf", b"%PDF-1.4" + b"0" * 128 * 1024, "application/pdf")},
+            )
+        self.assertEqual(resp.status_code, 413)
+        self.assertIn("File too large", resp.text)
+
+    def test_documents_reject_mismatched_content_sha256_header(self) -> None:
+        with patch("app.routers.documents._existing_document_by_checksum", new=AsyncMock(return_value=None)):
+            resp = self.client.post(
+                "/documents",
+                files={"file": ("doc.pdf", b"%PDF-1.4 payload", "application/pdf")},
+                headers={"X-Content-SHA256": "0" * 64},
+            )
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("does not match", resp.text)
+
     def test_ask_enforces_validation(self) -> None:
         resp = self.client.post("/ask", json={"question": "What is OVG?", "top_k": 999})
         self.assertEqual(resp.status_code, 422)
 
+    def test_ask_rejects_oversized_doc_id_scope(self) -> None:
+        doc_ids = [str(uuid4()) for _ in range(MAX_ASK_DOC_IDS + 1)]
+        resp = self.client.post("/ask", json={"question": "What is OVG?", "doc_ids": doc_ids})
+        self.assertEqual(resp.status_code, 422)
+
     def test_ask_happy_path_returns_citations(self) -> None:
         doc_id = uuid4()
         fake_embedding = SimpleNamespace(
@@ -183,6 +285,38 @@ class ApiContractTests(unittest.TestCase):
         self.assertEqual(resp.status_code, 404)
         self.assertIn("document not found", resp.text.lower())
 
+    def test_job_status_polls_are_served_from_cache(self) -> None:
+        job_id = uuid4()
+        now = datetime.now(timezone.utc)
+        calls = []
+
+        class FakeDb:
+            async def get(self, _model, _job_id):
+                calls.append(_job_id)
+                return SimpleNamespace(
+                    id=job_id,
+                    document_id=uuid4(),
+                    task_type="pipeline",
+                    status="processing",
+                    error_message=None,
+                    task_metadata=None,
+                    created_at=now,
+                    updated_at=now,
+                )
+
+        async def _jobs_db_dependency():
+            yield FakeDb()
+
+        app.dependency_overrides[get_db] = _jobs_db_dependency
+        with patch("app.routers.jobs.job_status_cache", TTLCache(60)):
+            first = self.client.get(f"/jobs/{job_id}")
+            second = self.client.get(f"/jobs/{job_id}")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["status"], "processing")
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(len(calls), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
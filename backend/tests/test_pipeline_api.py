@@ -1,34 +1,69 @@
 import unittest
+from contextlib import asynccontextmanager, contextmanager
 from datetime import UTC, datetime
 from types import SimpleNamespace
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 from uuid import uuid4
 
 from fastapi.testclient import TestClient
 
-from app.db.database import get_db
+from app.db.database import get_db, get_session_factory
 from app.main import app
 
 
+_SINGLE_UPLOAD_FILES = {"file": ("sample.pdf", b"%PDF-1.4", "application/pdf")}
+_BATCH_UPLOAD_FILES = [
+    ("files", ("a.pdf", b"%PDF-1.4", "application/pdf")),
+    ("files", ("b.pdf", b"%PDF-1.4", "application/pdf")),
+]
+
+
 async def _fake_db_dependency():
     yield SimpleNamespace()
 
 
+@asynccontextmanager
+async def _fake_session():
+    yield SimpleNamespace()
+
+
+_FAKE_DOCUMENT_FIELDS = {
+    "filename": "sample.pdf",
+    "checksum_sha256": "abc123",
+    "version": 1,
+    "total_pages": 2,
+    "created_at": datetime(2025, 1, 1, tzinfo=UTC),
+}
+
+
 def _fake_document(document_id):
-    return SimpleNamespace(
-        id=document_id,
-        filename="sample.pdf",
-        checksum_sha256="abc123",
-        version=1,
-        total_pages=2,
-        created_at=datetime.now(UTC),
-    )
+    return SimpleNamespace(id=document_id, **_FAKE_DOCUMENT_FIELDS)
+
+
+async def _all_processing(_db, document_ids):
+    return {doc_id: "processing" for doc_id in document_ids}
+
+
+@contextmanager
+def _patched_upload_pipeline(ingest: AsyncMock, queue: AsyncMock):
+    """Stub ingestion and pipeline queueing; every uploaded document reports as processing."""
+    with (
+        patch("app.routers.documents._ingest_pdf_upload", new=ingest),
+        patch("app.routers.documents._queue_pipeline", new=queue),
+        patch("app.routers.documents.compute_document_statuses", side_effect=_all_processing),
+    ):
+        yield
 
 
 class PipelineUploadApiTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        # The client holds no per-test state; the dependency override is what each test resets.
+        cls.client = TestClient(app)
+
     def setUp(self) -> None:
         app.dependency_overrides[get_db] = _fake_db_dependency
-        self.client = TestClient(app)
+        app.dependency_overrides[get_session_factory] = lambda: _fake_session
 
     def tearDown(self) -> None:
         app.dependency_overrides.clear()
@@ -37,24 +72,11 @@ class PipelineUploadApiTests(unittest.TestCase):
         document_id = uuid4()
         pipeline_job_id = uuid4()
 
-        async def _ingest(**kwargs):
-            return _fake_document(document_id)
+        ingest = AsyncMock(return_value=_fake_document(document_id))
+        queue = AsyncMock(return_value=pipeline_job_id)
 
-        async def _queue(**kwargs):
-            return pipeline_job_id
-
-        async def _status(_db, document_ids):
-            return {document_id: "processing"}
-
-        with (
-            patch("app.routers.documents._ingest_pdf_upload", side_effect=_ingest),
-            patch("app.routers.documents._queue_pipeline", side_effect=_queue),
-            patch("app.routers.documents.compute_document_statuses", side_effect=_status),
-        ):
-            resp = self.client.post(
-                "/documents",
-                files={"file": ("sample.pdf", b"%PDF-1.4", "application/pdf")},
-            )
+        with _patched_upload_pipeline(ingest, queue):
+            resp = self.client.post("/documents", files=_SINGLE_UPLOAD_FILES)
 
         self.assertEqual(resp.status_code, 200)
         payload = resp.json()
@@ -65,32 +87,12 @@ class PipelineUploadApiTests(unittest.TestCase):
     def test_batch_upload_returns_pipeline_ids(self) -> None:
         document_ids = [uuid4(), uuid4()]
         pipeline_job_ids = [uuid4(), uuid4()]
-        call_index = {"value": 0}
-
-        async def _ingest(**kwargs):
-            idx = call_index["value"]
-            call_index["value"] += 1
-            return _fake_document(document_ids[idx])
-
-        async def _queue(**kwargs):
-            idx = call_index["value"] - 1
-            return pipeline_job_ids[idx]
-
-        async def _status(_db, document_ids):
-            return {doc_id: "processing" for doc_id in document_ids}
-
-        with (
-            patch("app.routers.documents._ingest_pdf_upload", side_effect=_ingest),
-            patch("app.routers.documents._queue_pipeline", side_effect=_queue),
-            patch("app.routers.documents.compute_document_statuses", side_effect=_status),
-        ):
-            resp = self.client.post(
-                "/documents/batch",
-                files=[
-                    ("files", ("a.pdf", b"%PDF-1.4", "application/pdf")),
-                    ("files", ("b.pdf", b"%PDF-1.4", "application/pdf")),
-                ],
-            )
+        # Each upload is ingested and queued in turn, so the stubs answer in file order.
+        ingest = AsyncMock(side_effect=[_fake_document(doc_id) for doc_id in document_ids])
+        queue = AsyncMock(side_effect=pipeline_job_ids)
+
+        with _patched_upload_pipeline(ingest, queue):
+            resp = self.client.post("/documents/batch", files=_BATCH_UPLOAD_FILES)
 
         self.assertEqual(resp.status_code, 200)
         payload = resp.json()
@@ -99,6 +101,9 @@ class PipelineUploadApiTests(unittest.TestCase):
         self.assertEqual(payload[1]["pipeline_job_id"], str(pipeline_job_ids[1]))
         self.assertEqual(payload[0]["status"], "processing")
         self.assertEqual(payload[1]["status"], "processing")
+        self.assertEqual([call.kwargs["document_id"] for call in queue.await_args_list], document_ids)
+        # The get_session_factory override supplies every per-file session.
+        self.assertTrue(all(isinstance(call.kwargs["db"], SimpleNamespace) for call in ingest.await_args_list))
 
 
 if __name__ == "__main__":
@@ -131,6 +131,16 @@ class AnswerQuestionFallbackTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.answer, NOT_FOUND_ANSWER)
         self.assertEqual(result.citations, [])
 
+    async def test_answer_question_skips_model_when_no_context_selected(self) -> None:
+        async def _fake_create(*args, **kwargs):
+            raise AssertionError("model called without context")
+
+        with patch("app.services.qa.openai_client.chat.completions.create", side_effect=_fake_create):
+            response = await answer_question("What does OVG stand for?", [], request_id="test-empty")
+
+        self.assertEqual(response.answer, NOT_FOUND_ANSWER)
+        self.assertEqual(response.citations, [])
+
     async def test_answer_question_precision_retry_adds_numeric_threshold(self) -> None:
         chunks = [_make_chunk("p5-c0", 5)]
         chunks[0].embedding.content = "Solution gas may be conserved at 900 m3/day with NPV greater than -$55,000."
@@ -0,0 +1,83 @@
+import math
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+
+from app.services.retrieval_cache import ApproxEmbeddingCache
+from app.services.retriever import retrieve_chunks
+
+
+def _unit(*values: float) -> list[float]:
+    norm = math.sqrt(sum(value * value for value in values))
+    return [value / norm for value in values]
+
+
+class ApproxEmbeddingCacheTests(unittest.TestCase):
+    def test_near_identical_question_in_same_scope_hits(self) -> None:
+        cache = ApproxEmbeddingCache(capacity=8, max_distance=0.05, ttl_seconds=60)
+        cache.put("docs-a", _unit(1.0, 0.0, 0.0), ("chunks",), cache.generation)
+
+        self.assertEqual(cache.lookup("docs-a", _unit(1.0, 0.1, 0.0)), ("chunks",))
+        self.assertIsNone(cache.lookup("docs-a", _unit(1.0, 1.0, 0.0)))
+        self.assertIsNone(cache.lookup("docs-b", _unit(1.0, 0.0, 0.0)))
+
+    def test_invalidate_drops_entries_and_rejects_stale_results(self) -> None:
+        cache = ApproxEmbeddingCache(capacity=8, max_distance=0.05, ttl_seconds=60)
+        started_generation = cache.generation
+        cache.put("docs-a", _unit(1.0, 0.0), ("old",), started_generation)
+        cache.invalidate()
+
+        cache.put("docs-a", _unit(0.0, 1.0), ("stale",), started_generation)
+        self.assertIsNone(cache.lookup("docs-a", _unit(1.0, 0.0)))
+        self.assertIsNone(cache.lookup("docs-a", _unit(0.0, 1.0)))
+
+    def test_capacity_evicts_least_recently_used(self) -> None:
+        cache = ApproxEmbeddingCache(capacity=2, max_distance=0.01, ttl_seconds=60)
+        cache.put("s", _unit(1.0, 0.0, 0.0), "x", cache.generation)
+        cache.put("s", _unit(0.0, 1.0, 0.0), "y", cache.generation)
+        cache.lookup("s", _unit(1.0, 0.0, 0.0))
+        cache.put("s", _unit(0.0, 0.0, 1.0), "z", cache.generation)
+
+        self.assertEqual(cache.lookup("s", _unit(1.0, 0.0, 0.0)), "x")
+        self.assertIsNone(cache.lookup("s", _unit(0.0, 1.0, 0.0)))
+        self.assertEqual(cache.lookup("s", _unit(0.0, 0.0, 1.0)), "z")
+
+
+def _fake_db(chunk_id: str, content: str) -> SimpleNamespace:
+    """One retrieval: the set_config statement, then a single candidate row."""
+    row = (uuid4(), uuid4(), chunk_id, 1, 1, 1, 1, content, "invoices.pdf", 0.1, 1, 0.2)
+    result = SimpleNamespace(all=lambda: [row])
+    return SimpleNamespace(execute=AsyncMock(return_value=result))
+
+
+class RetrieveChunksCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_questions_differing_only_by_identifier_do_not_share_results(self) -> None:
+        cache = ApproxEmbeddingCache(capacity=8, max_distance=0.05, ttl_seconds=60)
+        question_embedding = _unit(1.0, 0.0, 0.0)
+        # Embeddings of the two questions are close enough for the cache to treat them as one.
+        similar_embedding = _unit(1.0, 0.05, 0.0)
+
+        async def _embed(texts, request_id=None):
+            return [question_embedding for _ in texts]
+
+        with (
+            patch("app.services.retriever.retrieval_cache", cache),
+            patch("app.services.retriever.generate_embeddings", side_effect=_embed),
+        ):
+            first_db = _fake_db("p1-c0", "Invoice 1042 total is 500 USD.")
+            first = await retrieve_chunks(first_db, "Total on invoice 1042?", question_embedding)
+            second_db = _fake_db("p2-c0", "Invoice 1043 total is 700 USD.")
+            second = await retrieve_chunks(second_db, "Total on invoice 1043?", similar_embedding)
+            repeat_db = _fake_db("p9-c0", "unused")
+            repeat = await retrieve_chunks(repeat_db, "total on invoice 1042", similar_embedding)
+
+        self.assertEqual([chunk.embedding.chunk_id for chunk in first], ["p1-c0"])
+        self.assertEqual([chunk.embedding.chunk_id for chunk in second], ["p2-c0"])
+        self.assertTrue(second_db.execute.await_count)
+        self.assertEqual([chunk.embedding.chunk_id for chunk in repeat], ["p1-c0"])
+        repeat_db.execute.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
 from pathlib import Path
-import runpy
+import sys
 
 
 if __name__ == "__main__":
-    target = Path(__file__).resolve().parents[1] / "backend" / "scripts" / "smoke_pipeline.py"
-    runpy.run_path(str(target), run_name="__main__")
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from backend.scripts.smoke_pipeline import main
+
+    raise SystemExit(main())